@@ -2,6 +2,8 @@ import json
 from collections import defaultdict
 from typing import Dict, List
 from client import LLMClient
+from config import MODEL_NAME
+from llm_cache import CachedLLMClient
 
 
 def build_question_to_canonical(clustered_questions):
@@ -53,7 +55,7 @@ def build_agent_stats(
 
 
 def summarize_agent(agent_id, agent_data):
-    llm = LLMClient()
+    llm = CachedLLMClient(LLMClient(), deployment=MODEL_NAME)
 
     prompt = f"""
 You are analyzing call-handling behavior for an insurance call center agent.
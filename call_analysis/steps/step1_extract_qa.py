@@ -1,7 +1,9 @@
 import json
 from client import LLMClient
+from config import MODEL_NAME
+from llm_cache import CachedLLMClient
 
-llm = LLMClient()
+llm = CachedLLMClient(LLMClient(), deployment=MODEL_NAME)
 
 def extract_qa(conversation_text: str):
     prompt = open("prompts/extract_qa.txt").read().format(
@@ -1,7 +1,9 @@
 import json
 from client import LLMClient
+from config import MODEL_NAME
+from llm_cache import CachedLLMClient
 
-llm = LLMClient()
+llm = CachedLLMClient(LLMClient(), deployment=MODEL_NAME)
 
 def generate_themes(clustered_questions):
     prompt = open("prompts/generate_themes.txt").read().format(
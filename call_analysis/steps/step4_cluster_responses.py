@@ -1,7 +1,9 @@
 import json
 from client import LLMClient
+from config import MODEL_NAME
+from llm_cache import CachedLLMClient
 
-llm = LLMClient()
+llm = CachedLLMClient(LLMClient(), deployment=MODEL_NAME)
 
 def cluster_responses(responses: list[str]):
     prompt = open("prompts/cluster_responses.txt").read().format(
@@ -6,3 +6,19 @@ AZURE_OPENAI_DEPLOYMENT = "gpt-4o"
 MODEL_NAME = "gpt-4o"
 MAX_MODEL_TOKENS = 128000
 SAFETY_MARGIN = 2000  # buffer for output tokens
+
+# MAP STEP concurrency (set to the deployment's Azure quota)
+MAX_CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 300
+TOKENS_PER_MINUTE = 150000
+MAP_OUTPUT_TOKENS = 1500  # expected completion tokens per chunk, counted against TPM
+MAX_RETRIES = 6
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 60.0
+
+# REDUCE STEP (hierarchical consolidate_categories)
+REDUCE_OUTPUT_TOKENS = 8000  # reserved for each consolidation response
+REDUCE_INTERMEDIATE_CATEGORIES = 25  # kept per group below the final level
+REDUCE_SINGLE_CATEGORIES = 10  # kept when outputs too large to pair are consolidated alone
+REDUCE_CHECKPOINT_DIR = "checkpoints/reduce"
+REDUCE_MAX_LEVELS = 8  # consolidate_categories gives up beyond this many levels
@@ -1,19 +1,45 @@
+import os
 import json
+import hashlib
+import threading
 from openai import AzureOpenAI
 from config import *
 from utils_token_chunking import count_tokens
+from llm_cache import LLMCache, cached_chat_completion, is_cached
+from rate_limit import run_map, call_with_retry
 
 client = AzureOpenAI(
     api_key=AZURE_OPENAI_API_KEY,
     api_version=AZURE_OPENAI_API_VERSION,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT
+    azure_endpoint=AZURE_OPENAI_ENDPOINT,
+    # retries happen in rate_limit.call_with_retry, under the rate limiter
+    max_retries=0,
 )
 
 MODEL = AZURE_OPENAI_DEPLOYMENT
 
+# identical prompts are answered from disk on reruns (see shared/llm_cache.py);
+# opened on first use, or injected with set_cache()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
+
+
+def set_cache(cache):
+    global _cache
+    _cache = cache
+
 
 # ---------------- MAP STEP ----------------
-def extract_questions_from_chunk(chunk, chunk_id):
+def _extract_messages(chunk):
     prompt = f"""
 You are analyzing insurance acquisition documents.
 
@@ -38,28 +64,37 @@ OUTPUT FORMAT (JSON):
 ]
 """
 
-    response = client.chat.completions.create(
+    return [
+        {"role": "system", "content": "You extract customer concerns from insurance communications."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def extract_questions_from_chunk(chunk, chunk_id):
+    content = cached_chat_completion(
+        client,
+        get_cache(),
         model=MODEL,
         temperature=0.3,
-        messages=[
-            {"role": "system", "content": "You extract customer concerns from insurance communications."},
-            {"role": "user", "content": prompt}
-        ]
+        messages=_extract_messages(chunk)
     )
 
     print(f"✓ Chunk {chunk_id} processed | Tokens: {count_tokens(chunk)}")
-    return json.loads(response.choices[0].message.content)
+    return json.loads(content)
 
 
-# ---------------- REDUCE STEP ----------------
-def consolidate_categories(all_chunk_outputs):
-    combined_text = json.dumps(all_chunk_outputs, indent=2)
+def chunk_is_cached(chunk):
+    """True when extract_questions_from_chunk(chunk) needs no request."""
+    return is_cached(client, get_cache(), model=MODEL, temperature=0.3,
+                     messages=_extract_messages(chunk))
 
-    prompt = f"""
+
+# ---------------- REDUCE STEP ----------------
+CONSOLIDATE_PROMPT = """
 You are consolidating customer question categories.
 
 Merge similar categories, remove duplicate questions,
-and keep only the TOP 10 most important categories
+and keep only the TOP {max_categories} most important categories
 with up to 20 strong representative questions each.
 
 INPUT:
@@ -74,17 +109,158 @@ OUTPUT FORMAT (JSON):
 ]
 """
 
-    response = client.chat.completions.create(
+CONSOLIDATE_SYSTEM = "You consolidate overlapping taxonomies."
+
+
+def consolidate_group(chunk_outputs, max_categories=10):
+    combined_text = json.dumps(chunk_outputs, indent=2)
+    prompt = CONSOLIDATE_PROMPT.format(max_categories=max_categories, combined_text=combined_text)
+
+    content = cached_chat_completion(
+        client,
+        get_cache(),
         model=MODEL,
         temperature=0.2,
         messages=[
-            {"role": "system", "content": "You consolidate overlapping taxonomies."},
+            {"role": "system", "content": CONSOLIDATE_SYSTEM},
             {"role": "user", "content": prompt}
         ]
     )
 
+    return json.loads(content)
+
+
+def pack_by_tokens(items, budget):
+    """Consecutive items grouped so each group's JSON fits in budget tokens."""
+    groups, current, current_tokens = [], [], 0
+
+    for item in items:
+        t = count_tokens(json.dumps(item, indent=2))
+        if current and current_tokens + t > budget:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += t
+
+    if current:
+        groups.append(current)
+    return groups
+
+
+def split_to_budget(output, budget):
+    """
+    Pieces of one output (a list of categories) that each fit in budget
+    tokens: the category list is halved, and a single oversized category
+    has its question list halved.
+    """
+    if count_tokens(json.dumps(output, indent=2)) <= budget:
+        return [output]
+
+    if len(output) > 1:
+        mid = len(output) // 2
+        return split_to_budget(output[:mid], budget) + split_to_budget(output[mid:], budget)
+
+    category = output[0]
+    questions = category.get("questions", [])
+    if len(questions) < 2:
+        raise ValueError(f"Category {category.get('category')!r} does not fit in {budget} tokens")
+
+    mid = len(questions) // 2
+    return (split_to_budget([{**category, "questions": questions[:mid]}], budget)
+            + split_to_budget([{**category, "questions": questions[mid:]}], budget))
+
+
+def consolidate_categories(all_chunk_outputs, checkpoint_dir=REDUCE_CHECKPOINT_DIR, limiter=None):
+    """
+    Token-budgeted tree reduce: chunk outputs are packed into groups that
+    fit the context, groups are consolidated in parallel, and the group
+    results are packed and consolidated again until one group is left.
+    An output larger than the budget is split first; when no two outputs
+    fit together, each is consolidated alone down to
+    REDUCE_SINGLE_CATEGORIES so the next level can pair them.
+    Every group result is checkpointed under checkpoint_dir (keyed by a
+    hash of its input), so an interrupted run resumes where it stopped.
+    Raises ValueError after REDUCE_MAX_LEVELS levels, or when a level of
+    outputs consolidated alone still leaves no two that fit together.
+    Pass the pipeline's limiter so every level shares one RPM/TPM budget.
+    """
+    overhead = (
+        count_tokens(CONSOLIDATE_SYSTEM)
+        + count_tokens(CONSOLIDATE_PROMPT.format(max_categories=10, combined_text=""))
+    )
+    budget = MAX_MODEL_TOKENS - SAFETY_MARGIN - REDUCE_OUTPUT_TOKENS - overhead
+
+    def estimate_tokens(group):
+        return count_tokens(json.dumps(group, indent=2)) + overhead + REDUCE_OUTPUT_TOKENS
+
+    items = all_chunk_outputs
+    level = 0
+    shrunk_alone = False
+
+    while True:
+        items = [piece for item in items for piece in split_to_budget(item, budget)]
+        groups = pack_by_tokens(items, budget) or [[]]
+        if len(groups) == 1:
+            break
+
+        if level >= REDUCE_MAX_LEVELS:
+            raise ValueError(f"{len(groups)} groups left after {REDUCE_MAX_LEVELS} reduce levels")
+
+        if len(groups) < len(items):
+            max_categories = REDUCE_INTERMEDIATE_CATEGORIES
+            shrunk_alone = False
+        elif shrunk_alone:
+            raise ValueError(
+                f"Reduce level {level} makes no progress: {len(items)} outputs still "
+                f"do not pair after consolidating each to {REDUCE_SINGLE_CATEGORIES} categories"
+            )
+        else:
+            max_categories = REDUCE_SINGLE_CATEGORIES
+            shrunk_alone = True
+
+        print(f"Reduce level {level}: {len(items)} outputs → {len(groups)} groups")
+        items = run_map(
+            lambda group, n: _consolidate_checkpointed(
+                group, max_categories, checkpoint_dir, level),
+            groups,
+            estimate_tokens=estimate_tokens,
+            limiter=limiter,
+            is_cached=lambda group: os.path.exists(
+                _checkpoint_path(group, max_categories, checkpoint_dir, level)),
+        )
+        level += 1
+
+    if os.path.exists(_checkpoint_path(groups[0], 10, checkpoint_dir, level)):
+        consolidated = _consolidate_checkpointed(groups[0], 10, checkpoint_dir, level)
+    else:
+        consolidated = call_with_retry(_consolidate_checkpointed, groups[0], 10, checkpoint_dir, level,
+                                       limiter=limiter, tokens=estimate_tokens(groups[0]))
     print("✓ Categories consolidated")
-    return json.loads(response.choices[0].message.content)
+    return consolidated
+
+
+def _checkpoint_path(group, max_categories, checkpoint_dir, level):
+    digest = hashlib.sha256(
+        json.dumps([group, max_categories], sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+    return os.path.join(checkpoint_dir, f"level{level}_{digest}.json")
+
+
+def _consolidate_checkpointed(group, max_categories, checkpoint_dir, level):
+    path = _checkpoint_path(group, max_categories, checkpoint_dir, level)
+
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    result = consolidate_group(group, max_categories)
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+    return result
 
 
 # ---------------- FINAL ANSWERS ----------------
@@ -112,7 +288,9 @@ OUTPUT FORMAT (JSON):
 ]
 """
 
-    response = client.chat.completions.create(
+    content = cached_chat_completion(
+        client,
+        get_cache(),
         model=MODEL,
         temperature=0.3,
         messages=[
@@ -122,4 +300,4 @@ OUTPUT FORMAT (JSON):
     )
 
     print("✓ Agent answers generated")
-    return json.loads(response.choices[0].message.content)
+    return json.loads(content)
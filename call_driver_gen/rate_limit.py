@@ -0,0 +1,123 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+import openai
+
+from config import (
+    MAX_CONCURRENCY,
+    REQUESTS_PER_MINUTE,
+    TOKENS_PER_MINUTE,
+    MAX_RETRIES,
+    BACKOFF_BASE_S,
+    BACKOFF_MAX_S,
+)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets (token buckets),
+    shared by every worker thread.
+    """
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.request_budget = float(requests_per_minute)
+        self.token_budget = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.request_budget = min(self.rpm, self.request_budget + elapsed * self.rpm / 60)
+        self.token_budget = min(self.tpm, self.token_budget + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens):
+        # a single request larger than the whole budget waits for a full bucket
+        tokens = min(tokens, self.tpm)
+
+        while True:
+            with self.lock:
+                self._refill()
+                if self.request_budget >= 1 and self.token_budget >= tokens:
+                    self.request_budget -= 1
+                    self.token_budget -= tokens
+                    return
+
+                wait = max(
+                    (1 - self.request_budget) * 60 / self.rpm,
+                    (tokens - self.token_budget) * 60 / self.tpm,
+                )
+            time.sleep(max(wait, 0.01))
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retry(fn, *args, max_retries=MAX_RETRIES, limiter=None, tokens=0, **kwargs):
+    """
+    Retries 429 / 5xx / connection errors with full-jitter exponential
+    backoff, honoring Retry-After when the service sends it. With a
+    limiter every attempt, retries included, is admitted for `tokens`.
+    """
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire(tokens)
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+
+            print(f"⚠ {type(e).__name__}, retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def run_map(fn, items, estimate_tokens, max_workers=MAX_CONCURRENCY, limiter=None,
+            is_cached=None):
+    """
+    fn(item, item_number) for every item on a bounded thread pool, each
+    attempt admitted by the rate limiter. Results are returned in item order.
+    The first error that survives its retries cancels the items not yet
+    started and is raised.
+
+    Items for which is_cached(item) is true are answered without a request,
+    so they run without acquiring any RPM/TPM budget.
+    """
+    limiter = limiter or RateLimiter()
+
+    def run_one(i, item):
+        if is_cached is not None and is_cached(item):
+            return fn(item, i + 1)
+        return call_with_retry(fn, item, i + 1, limiter=limiter, tokens=estimate_tokens(item))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(run_one, i, item) for i, item in enumerate(items)]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        for f in pending:
+            f.cancel()
+        for f in futures:
+            if f in done and f.exception() is not None:
+                raise f.exception()
+        return [f.result() for f in futures]
@@ -1,9 +1,12 @@
 import os
 import json
 from glob import glob
-from utils_token_chunking import chunk_by_tokens
+from config import MAP_OUTPUT_TOKENS
+from utils_token_chunking import chunk_by_tokens, count_tokens, SYSTEM_TOKENS, USER_TEMPLATE_TOKENS
+from rate_limit import RateLimiter, run_map
 from llm_pipeline import (
     extract_questions_from_chunk,
+    chunk_is_cached,
     consolidate_categories,
     generate_answers
 )
@@ -34,14 +37,22 @@ def main():
 
     print(f"Total chunks created: {len(all_chunks)}")
 
-    # MAP STEP
-    chunk_outputs = []
-    for i, chunk in enumerate(all_chunks):
-        result = extract_questions_from_chunk(chunk, i + 1)
-        chunk_outputs.append(result)
+    # one RPM/TPM budget for every step of the run
+    limiter = RateLimiter()
+
+    # MAP STEP (concurrent, rate limited, results in chunk order)
+    chunk_outputs = run_map(
+        extract_questions_from_chunk,
+        all_chunks,
+        estimate_tokens=lambda chunk: (
+            count_tokens(chunk) + SYSTEM_TOKENS + USER_TEMPLATE_TOKENS + MAP_OUTPUT_TOKENS
+        ),
+        limiter=limiter,
+        is_cached=chunk_is_cached,
+    )
 
     # REDUCE STEP
-    consolidated = consolidate_categories(chunk_outputs)
+    consolidated = consolidate_categories(chunk_outputs, limiter=limiter)
 
     # FINAL ANSWERS
     final_qna = generate_answers(consolidated)
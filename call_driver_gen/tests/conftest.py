@@ -0,0 +1,9 @@
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# the pipeline modules import each other as top-level modules; llm_cache
+# comes from shared/ (pip install -e shared outside the tests)
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(HERE)), "shared"))
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+import llm_pipeline
+import rate_limit
+
+BUDGET = 1000
+
+
+def _output(tag, n_questions):
+    return [{"category": tag, "questions": [f"{tag} question {i:03d}" for i in range(n_questions)]}]
+
+
+@pytest.fixture
+def char_tokens(monkeypatch):
+    """One token per character and a reduce budget of BUDGET tokens."""
+    monkeypatch.setattr(llm_pipeline, "count_tokens", len)
+    monkeypatch.setattr(llm_pipeline, "SAFETY_MARGIN", 0)
+    monkeypatch.setattr(llm_pipeline, "REDUCE_OUTPUT_TOKENS", 0)
+    overhead = len(llm_pipeline.CONSOLIDATE_SYSTEM) + len(
+        llm_pipeline.CONSOLIDATE_PROMPT.format(max_categories=10, combined_text=""))
+    monkeypatch.setattr(llm_pipeline, "MAX_MODEL_TOKENS", overhead + BUDGET)
+
+
+def test_split_to_budget_halves_categories_and_questions(char_tokens):
+    output = _output("a", 10) + _output("b", 100)
+
+    pieces = llm_pipeline.split_to_budget(output, BUDGET)
+
+    assert all(len(json.dumps(p, indent=2)) <= BUDGET for p in pieces)
+    questions = [q for p in pieces for c in p for q in c["questions"]]
+    assert questions == output[0]["questions"] + output[1]["questions"]
+
+
+def test_consolidate_outputs_too_large_to_pair(char_tokens, monkeypatch, tmp_path):
+    calls = []
+
+    def consolidate_group(outputs, max_categories):
+        assert len(json.dumps(outputs, indent=2)) <= BUDGET
+        calls.append(max_categories)
+        return [{"category": f"merged {outputs[0][0]['questions'][0]}", "questions": ["q"]}]
+
+    monkeypatch.setattr(llm_pipeline, "consolidate_group", consolidate_group)
+
+    # no two of these fit together, and the last one does not fit at all
+    outputs = [_output("a", 30), _output("b", 30), _output("c", 100)]
+    result = llm_pipeline.consolidate_categories(outputs, checkpoint_dir=str(tmp_path))
+
+    # a, b and the four pieces of c shrunk alone, then one final merge
+    assert calls[:-1] == [llm_pipeline.REDUCE_SINGLE_CATEGORIES] * 6
+    assert calls[-1] == 10
+    assert result[0]["category"].startswith("merged")
+
+    def fail(outputs, max_categories):
+        raise AssertionError("resumed run must not call the model")
+
+    def no_budget(self, tokens):
+        raise AssertionError("resumed run must not spend rate-limit budget")
+
+    monkeypatch.setattr(llm_pipeline, "consolidate_group", fail)
+    monkeypatch.setattr(rate_limit.RateLimiter, "acquire", no_budget)
+    assert llm_pipeline.consolidate_categories(outputs, checkpoint_dir=str(tmp_path)) == result
+
+
+def test_consolidate_stops_when_a_level_makes_no_progress(char_tokens, monkeypatch, tmp_path):
+    # the "consolidated" output is as large as its input, so nothing ever pairs
+    monkeypatch.setattr(llm_pipeline, "consolidate_group", lambda outputs, max_categories: outputs[0])
+
+    with pytest.raises(ValueError, match="no progress"):
+        llm_pipeline.consolidate_categories([_output("a", 30), _output("b", 30)],
+                                            checkpoint_dir=str(tmp_path))
@@ -11,59 +11,618 @@ If you see:
 m=32 → use M=32
 nothing specified → default M=16
 
+Build once (offline):
+    python ann.py build --data embedded_store --out faiss_index
+
+Load many (every worker):
+    index, manifest = load_index("faiss_index")
+
+Autotune efSearch per top_k (optional, stored in the manifest):
+    python ann.py autotune faiss_index --data embedded_store --recall 0.98
+    semantic_retrieval_faiss(..., ef_search=manifest.get("ef_search_by_top_k"))
+
+The index file is memory-mapped read-only, so worker processes on the
+same box share its pages through the OS page cache.
 """
 
+import os
+import sys
+import json
+import time
 import pickle
+import hashlib
+import argparse
 import numpy as np
 import pandas as pd
 import faiss
 
+from store import EmbeddingStore, take_rows, dense_matrix
+from profiling import stage, candidates
 
-with open("embedded_data.pickle", "rb") as f:
-    df = pickle.load(f)
-
-# Ensure dense embeddings are float32 numpy arrays
-dense_matrix = np.vstack(df["dense_embedding"].values).astype("float32")
 
-# Normalize for cosine distance (CRITICAL)
-faiss.normalize_L2(dense_matrix)
-
-# 🔹 Build FAISS HNSW index (matches pgvector)
-DIM = dense_matrix.shape[1]
 M = 32  # MUST match pgvector index m
+EF_CONSTRUCTION = 40  # faiss default
 EF_SEARCH = 400
 
-index = faiss.IndexHNSWFlat(DIM, M, faiss.METRIC_INNER_PRODUCT)
+# compressed index options
+NLIST = None  # IVF lists; None → 4 * sqrt(n)
+PQ_M = 64  # PQ sub-quantizers, must divide DIM (8 bits each)
+NPROBE = 32
+RERANK_FACTOR = 4  # re-rank top_k * RERANK_FACTOR candidates when compressed
+TRAIN_SAMPLE = 200_000
+RECALL_SAMPLE = 50_000  # corpus rows for the hnsw_flat recall baseline
+
+# bytes per vector (DIM=768): flat 3072, fp16 1536, sq8 768, pq64 64
+INDEX_TYPES = ("hnsw_flat", "hnsw_fp16", "hnsw_sq8", "ivf_pq")
+
+INDEX_FILE = "index.faiss"
+MANIFEST_FILE = "manifest.json"
+
+
+def load_dense_matrix(df) -> np.ndarray:
+    # Ensure dense embeddings are a writable float32 copy
+    # (works for a DataFrame or a memory-mapped EmbeddingStore)
+    dense = np.array(dense_matrix(df), dtype="float32", order="C")
+
+    # Normalize for cosine distance (CRITICAL)
+    faiss.normalize_L2(dense)
+    return dense
+
+
+def corpus_hash(dense_matrix: np.ndarray) -> str:
+    h = hashlib.sha256()
+    h.update(str(dense_matrix.shape).encode())
+    h.update(np.ascontiguousarray(dense_matrix).data)
+    return h.hexdigest()
+
+
+def index_factory_string(
+    index_type: str,
+    n_vectors: int,
+    m: int = M,
+    nlist: int = NLIST,
+    pq_m: int = PQ_M,
+) -> str:
+    if index_type == "hnsw_flat":
+        return f"HNSW{m},Flat"
+    if index_type == "hnsw_fp16":
+        return f"HNSW{m}_SQfp16"
+    if index_type == "hnsw_sq8":
+        return f"HNSW{m}_SQ8"
+    if index_type == "ivf_pq":
+        nlist = nlist or max(1, int(4 * np.sqrt(n_vectors)))
+        return f"IVF{nlist},PQ{pq_m}"
+    raise ValueError(f"Unknown index_type {index_type!r}, expected one of {INDEX_TYPES}")
+
+
+def set_search_params(
+    index: faiss.Index,
+    index_type: str = "hnsw_flat",
+    ef_search: int = None,
+    nprobe: int = None,
+) -> None:
+    # ParameterSpace also reaches through IndexIDMap-style wrappers
+    ps = faiss.ParameterSpace()
+    if index_type.startswith("hnsw") and ef_search is not None:
+        ps.set_index_parameter(index, "efSearch", ef_search)
+    if index_type.startswith("ivf") and nprobe is not None:
+        ps.set_index_parameter(index, "nprobe", nprobe)
+
+
+def new_index(
+    dim: int,
+    n_vectors: int,
+    m: int = M,
+    ef_construction: int = EF_CONSTRUCTION,
+    index_type: str = "hnsw_flat",
+    nlist: int = NLIST,
+    pq_m: int = PQ_M,
+) -> faiss.Index:
+    """Empty (possibly untrained) index; n_vectors only sizes IVF lists."""
+    if index_type == "hnsw_flat":
+        index = faiss.IndexHNSWFlat(dim, m, faiss.METRIC_INNER_PRODUCT)
+    else:
+        factory = index_factory_string(index_type, n_vectors, m, nlist, pq_m)
+        index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+
+    if hasattr(index, "hnsw"):
+        index.hnsw.efConstruction = ef_construction
+
+    return index
+
+
+def build_index(
+    dense_matrix: np.ndarray,
+    m: int = M,
+    ef_construction: int = EF_CONSTRUCTION,
+    ef_search: int = EF_SEARCH,
+    index_type: str = "hnsw_flat",
+    nlist: int = NLIST,
+    pq_m: int = PQ_M,
+    nprobe: int = NPROBE,
+) -> faiss.Index:
+    """
+    Build FAISS HNSW index (matches pgvector), or a compressed variant.
+    dense_matrix must already be L2-normalized float32.
+    """
+    index = new_index(
+        dense_matrix.shape[1], len(dense_matrix), m, ef_construction,
+        index_type=index_type, nlist=nlist, pq_m=pq_m,
+    )
+
+    if not index.is_trained:
+        # SQ ranges / IVF centroids / PQ codebooks from a sample
+        rng = np.random.default_rng(0)
+        n_train = min(len(dense_matrix), TRAIN_SAMPLE)
+        sample = dense_matrix[np.sort(rng.choice(len(dense_matrix), n_train, replace=False))]
+        index.train(sample)
+
+    index.add(dense_matrix)
+    set_search_params(index, index_type, ef_search=ef_search, nprobe=nprobe)
+
+    return index
+
+
+def save_index(index: faiss.Index, out_dir: str, manifest: dict) -> None:
+    os.makedirs(out_dir, exist_ok=True)
+
+    # write to temp names first so readers never see a half-written index
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+
+    faiss.write_index(index, index_path + ".tmp")
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(index_path + ".tmp", index_path)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def load_index(index_dir: str, expected_hash: str = None, mmap: bool = True):
+    """
+    Returns (index, manifest).
+    With mmap=True the index is opened read-only and memory-mapped.
+    """
+    with open(os.path.join(index_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+
+    if expected_hash is not None and manifest["corpus_hash"] != expected_hash:
+        raise ValueError(
+            f"Index in {index_dir} was built for a different corpus "
+            f"({manifest['corpus_hash'][:12]} != {expected_hash[:12]})"
+        )
+
+    # IO_FLAG_MMAP alone still copies the HNSW/Flat storage into private
+    # memory; MMAP_IFC keeps the vectors in the shared file mapping
+    flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = faiss.read_index(os.path.join(index_dir, INDEX_FILE), flags)
+
+    if index.d != manifest["dim"]:
+        raise ValueError("Index dimension does not match manifest")
+
+    set_search_params(
+        index, manifest.get("index_type", "hnsw_flat"),
+        ef_search=manifest.get("ef_search"), nprobe=manifest.get("nprobe"),
+    )
+
+    return index, manifest
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Mean fraction of the exact top-k rows found, (n_queries, k) inputs."""
+    hits = [len(np.intersect1d(f[f >= 0], t)) for f, t in zip(found, truth)]
+    return float(np.sum(hits) / truth.size)
+
+
+def measure_recall(
+    index: faiss.Index,
+    dense_matrix: np.ndarray,
+    top_k: int = 20,
+    n_queries: int = 200,
+    rerank_factor: int = 0,
+) -> float:
+    """
+    recall@top_k against brute force, using corpus vectors as queries.
+    dense_matrix must be the normalized full-precision vectors; the exact
+    search scans it in blocks, so no second copy of the corpus is built.
+    """
+    from runner import exact_dense_search
+
+    rng = np.random.default_rng(1)
+    queries = dense_matrix[rng.choice(len(dense_matrix), min(n_queries, len(dense_matrix)), replace=False)]
+
+    truth, _ = exact_dense_search(dense_matrix, queries, top_k)
+
+    found, _ = semantic_candidates_faiss(
+        index, queries, top_k,
+        rerank_vectors=dense_matrix if rerank_factor else None,
+        rerank_factor=rerank_factor,
+    )
+    return recall_at_k(found, truth)
+
+
+def sampled_recall_baseline(
+    dense_matrix: np.ndarray,
+    index_type: str,
+    m: int = M,
+    ef_construction: int = EF_CONSTRUCTION,
+    ef_search: int = EF_SEARCH,
+    pq_m: int = PQ_M,
+    nprobe: int = NPROBE,
+    rerank_factor: int = 0,
+    sample: int = RECALL_SAMPLE,
+):
+    """
+    (recall of index_type, recall of hnsw_flat), both built on the same
+    sample of at most `sample` corpus rows and measured against exact
+    search on it; memory follows the sample, not the corpus.
+    """
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(len(dense_matrix), min(sample, len(dense_matrix)), replace=False))
+    subset = np.ascontiguousarray(dense_matrix[rows])
+
+    # nlist=None sizes the IVF lists for the sample
+    compressed = build_index(subset, m, ef_construction, ef_search, index_type=index_type,
+                             nlist=None, pq_m=pq_m, nprobe=nprobe)
+    recall = measure_recall(compressed, subset, rerank_factor=rerank_factor)
+    del compressed
+
+    baseline = measure_recall(build_index(subset, m, ef_construction, ef_search), subset)
+    return recall, baseline
+
+
+def build_and_save(
+    data_path: str,
+    out_dir: str,
+    m: int = M,
+    ef_construction: int = EF_CONSTRUCTION,
+    ef_search: int = EF_SEARCH,
+    index_type: str = "hnsw_flat",
+    nlist: int = NLIST,
+    pq_m: int = PQ_M,
+    nprobe: int = NPROBE,
+    rerank_factor: int = None,
+    recall_tolerance: float = None,
+):
+    """
+    recall_tolerance: for compressed types, also measure recall@20 of the
+    built index against exact search, compare the compressed type with
+    hnsw_flat on a RECALL_SAMPLE-row sample (no full-corpus hnsw_flat is
+    built), record all three in the manifest and fail if the sampled gap
+    exceeds the tolerance.
+    """
+    t0 = time.time()
+    if os.path.isdir(data_path):
+        df = EmbeddingStore.open(data_path)
+    else:
+        with open(data_path, "rb") as f:
+            df = pickle.load(f)
+
+    dense_matrix = load_dense_matrix(df)
+
+    index = build_index(
+        dense_matrix, m, ef_construction, ef_search,
+        index_type=index_type, nlist=nlist, pq_m=pq_m, nprobe=nprobe,
+    )
+
+    if rerank_factor is None:
+        rerank_factor = 0 if index_type == "hnsw_flat" else RERANK_FACTOR
+
+    manifest = {
+        "index_type": index_type,
+        "dim": int(dense_matrix.shape[1]),
+        "n_vectors": int(dense_matrix.shape[0]),
+        "m": m,
+        "ef_construction": ef_construction,
+        "ef_search": ef_search,
+        "metric": "inner_product",
+        "rerank_factor": rerank_factor,
+        "corpus_hash": corpus_hash(dense_matrix),
+        "source": os.path.abspath(data_path),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if index_type == "ivf_pq":
+        manifest.update({
+            "factory": index_factory_string(index_type, len(dense_matrix), m, nlist, pq_m),
+            "nlist": nlist,
+            "pq_m": pq_m,
+            "nprobe": nprobe,
+        })
+
+    if recall_tolerance is not None and index_type != "hnsw_flat":
+        recall = measure_recall(index, dense_matrix, rerank_factor=rerank_factor)
+        sample_recall, baseline = sampled_recall_baseline(
+            dense_matrix, index_type, m, ef_construction, ef_search,
+            pq_m=pq_m, nprobe=nprobe, rerank_factor=rerank_factor,
+        )
+        manifest.update({"recall_at_20": recall, "sample_recall_at_20": sample_recall,
+                         "baseline_recall_at_20": baseline,
+                         "recall_sample": min(RECALL_SAMPLE, len(dense_matrix)),
+                         "recall_tolerance": recall_tolerance})
+        print(f"recall@20 {recall:.4f}; on {manifest['recall_sample']} rows "
+              f"{sample_recall:.4f} (hnsw_flat {baseline:.4f})")
+
+        if baseline - sample_recall > recall_tolerance:
+            raise ValueError(
+                f"{index_type} recall {sample_recall:.4f} is more than {recall_tolerance} "
+                f"below hnsw_flat ({baseline:.4f}) on a {manifest['recall_sample']}-row sample; "
+                f"raise rerank_factor/nprobe/pq_m"
+            )
+
+    save_index(index, out_dir, manifest)
+
+    print(f"✓ Built {manifest['n_vectors']} vectors in {time.time() - t0:.1f}s → {out_dir}")
+    return manifest
+
 
-index.hnsw.efSearch = EF_SEARCH
-index.add(dense_matrix)
+RESULT_COLUMNS = [
+    "embedding_id", "article_id", "document",
+    "lexical_score", "cosine_similarity", "metadata",
+]
 
 
 def semantic_retrieval_faiss(
     df: pd.DataFrame,
     index: faiss.Index,
     query_dense: np.ndarray,
-    top_k: int
+    top_k: int,
+    rerank_factor: int = 0,
+    ef_search=None,
 ) -> pd.DataFrame:
-    q = query_dense.astype("float32").reshape(1, -1)
+    out = semantic_retrieval_faiss_batch(df, index, query_dense, top_k, rerank_factor, ef_search)
+    return out[RESULT_COLUMNS]
+
+
+def semantic_candidates_faiss(
+    index: faiss.Index,
+    query_dense: np.ndarray,
+    top_k: int,
+    rerank_vectors: np.ndarray = None,
+    rerank_factor: int = 0,
+    ef_search=None,
+):
+    """
+    (row idx, cosine distance) arrays of shape (n_queries, top_k); no row data.
+    Missing hits are padded with idx -1.
+
+    With rerank_factor > 0, top_k * rerank_factor candidates are fetched and
+    rescored against rerank_vectors (full-precision, e.g. the store's
+    memory-mapped dense.npy; only candidate rows are read).
+
+    ef_search: int, or the autotuned manifest["ef_search_by_top_k"] table;
+    applied per call, the index's own efSearch is left untouched.
+    """
+    # copy: normalize_L2 works in place
+    q = np.array(query_dense, dtype="float32", ndmin=2, order="C")
     faiss.normalize_L2(q)
 
-    # Inner product similarity
-    sims, idxs = index.search(q, top_k)
-
-    rows = []
-    for sim, idx in zip(sims[0], idxs[0]):
-        row = df.iloc[idx]
-        rows.append({
-            "embedding_id": row["embedding_id"],
-            "article_id": row["article_id"],
-            "document": row["document"],
-            "lexical_score": None,
-            "cosine_similarity": 1 - sim,  # convert similarity → distance
-            "metadata": row["metadata"],
-        })
+    n_fetch = top_k * rerank_factor if rerank_factor and rerank_vectors is not None else top_k
+    params = search_params_for(index, ef_search, n_fetch)
+
+    if n_fetch != top_k:
+        with stage("semantic.search"):
+            _, cand = index.search(q, n_fetch, params=params)
+        candidates("semantic.search", n_fetch)
+        with stage("semantic.rerank"):
+            return rerank_exact(q, cand, rerank_vectors, top_k)
+
+    # one search call for the whole batch
+    with stage("semantic.search"):
+        sims, idxs = index.search(q, top_k, params=params)
+    candidates("semantic.search", top_k)
+
+    return idxs, 1 - sims  # convert similarity → distance
+
+
+def ef_search_for(ef_table: dict, top_k: int, default: int = EF_SEARCH) -> int:
+    """
+    efSearch for a query from an autotuned {top_k bucket: ef} table:
+    the smallest bucket >= top_k; default (never below top_k) when no
+    bucket is large enough.
+    """
+    # JSON round-trips the bucket keys as strings
+    table = {int(k): int(v) for k, v in ef_table.items()}
+    for bucket in sorted(table):
+        if bucket >= top_k:
+            return table[bucket]
+    return max(default, top_k)
+
+
+def _is_hnsw(index: faiss.Index) -> bool:
+    index = faiss.downcast_index(index)
+    # unwrap IndexIDMap / IndexPreTransform style wrappers
+    while not hasattr(index, "hnsw") and hasattr(index, "index"):
+        index = faiss.downcast_index(index.index)
+    return hasattr(index, "hnsw")
+
+
+def search_params_for(index: faiss.Index, ef_search, top_k: int):
+    if ef_search is None or not _is_hnsw(index):
+        return None
+    if isinstance(ef_search, dict):
+        ef_search = ef_search_for(ef_search, top_k)
+    return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+
+
+def selector_params(index: faiss.Index, sel, ef_search=None, nprobe=None, top_k: int = 0):
+    """
+    Search params of the index's own type (HNSW / IVF) carrying the ID
+    selector sel; ef_search / nprobe default to the index's own settings.
+    """
+    inner = faiss.downcast_index(index)
+    while not hasattr(inner, "hnsw") and hasattr(inner, "index"):
+        inner = faiss.downcast_index(inner.index)
+
+    if hasattr(inner, "hnsw"):
+        if ef_search is None:
+            ef_search = inner.hnsw.efSearch
+        elif isinstance(ef_search, dict):
+            ef_search = ef_search_for(ef_search, top_k)
+        params = faiss.SearchParametersHNSW(efSearch=int(ef_search))
+    elif isinstance(inner, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(nprobe=int(nprobe or inner.nprobe))
+    else:
+        params = faiss.SearchParameters()
+
+    params.sel = sel
+    # the selector (and whatever buffer it points into) must outlive the search
+    params._sel_ref = sel
+    return params
+
+
+def autotune_ef_search(
+    index: faiss.Index,
+    dense_matrix: np.ndarray,
+    queries: np.ndarray,
+    recall_target: float = 0.98,
+    top_k_buckets=(10, 20, 50, 100),
+    ef_candidates=(16, 24, 32, 48, 64, 96, 128, 192, 256, 384, 512, 768, 1024),
+) -> dict:
+    """
+    Smallest efSearch per top_k bucket whose recall@k against exact search
+    on `queries` reaches recall_target. dense_matrix: normalized corpus.
+    Returns {"<top_k>": ef}; buckets that never reach the target get the
+    largest candidate.
+    """
+    from runner import exact_dense_search
+
+    q = np.array(queries, dtype="float32", ndmin=2, order="C")
+    faiss.normalize_L2(q)
+
+    truth, _ = exact_dense_search(dense_matrix, q, max(top_k_buckets))
+
+    table = {}
+    for k in sorted(top_k_buckets):
+        candidates = [ef for ef in ef_candidates if ef >= k] or [k]
+
+        # recall is monotone in efSearch: binary search the candidate list
+        lo, hi = 0, len(candidates) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            params = faiss.SearchParametersHNSW(efSearch=candidates[mid])
+            _, found = index.search(q, k, params=params)
+            if recall_at_k(found, truth[:, :k]) >= recall_target:
+                hi = mid
+            else:
+                lo = mid + 1
+
+        table[str(k)] = candidates[lo]
+        print(f"  top_k={k}: efSearch={candidates[lo]}")
+
+    return table
 
-    return pd.DataFrame(rows)
+
+def tune_and_save(
+    index_dir: str,
+    data_path: str,
+    recall_target: float = 0.98,
+    top_k_buckets=(10, 20, 50, 100),
+    n_queries: int = 500,
+    queries_path: str = None,
+) -> dict:
+    """
+    Autotune an index on disk and store the table in its manifest.
+    Queries come from queries_path (.npy, held-out) or are sampled corpus rows.
+    """
+    index, manifest = load_index(index_dir, mmap=False)
+    if not manifest.get("index_type", "hnsw_flat").startswith("hnsw"):
+        raise ValueError("efSearch autotuning only applies to HNSW indexes")
+
+    if os.path.isdir(data_path):
+        df = EmbeddingStore.open(data_path)
+    else:
+        with open(data_path, "rb") as f:
+            df = pickle.load(f)
+    dense = load_dense_matrix(df)
+
+    if queries_path:
+        queries = np.load(queries_path)
+    else:
+        rng = np.random.default_rng(2)
+        queries = dense[rng.choice(len(dense), min(n_queries, len(dense)), replace=False)]
+
+    manifest["ef_search_by_top_k"] = autotune_ef_search(
+        index, dense, queries, recall_target, top_k_buckets
+    )
+    manifest["autotune_recall_target"] = recall_target
+
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    return manifest
+
+
+def rerank_exact(q: np.ndarray, cand: np.ndarray, vectors: np.ndarray, top_k: int):
+    """
+    Exact cosine rescoring of candidate rows. q is normalized (n_queries, DIM);
+    cand is (n_queries, n_cand) row ids padded with -1.
+    """
+    out_idx = np.full((len(q), top_k), -1, dtype=np.int64)
+    out_dist = np.full((len(q), top_k), np.inf, dtype=np.float32)
+
+    for i, (qv, rows) in enumerate(zip(q, cand)):
+        rows = rows[rows >= 0]
+        if not len(rows):
+            continue
+
+        # sorted reads are sequential on the memmap
+        rows = np.sort(rows)
+        vecs = np.asarray(vectors[rows], dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1)
+        sims = (vecs @ qv) / np.where(norms > 0, norms, 1)
+
+        order = np.argsort(-sims, kind="stable")[:top_k]
+        out_idx[i, :len(order)] = rows[order]
+        out_dist[i, :len(order)] = 1 - sims[order]
+
+    return out_idx, out_dist
+
+
+def semantic_retrieval_faiss_batch(
+    df: pd.DataFrame,
+    index: faiss.Index,
+    query_dense: np.ndarray,
+    top_k: int,
+    rerank_factor: int = 0,
+    ef_search=None,
+) -> pd.DataFrame:
+    """
+    Batched version of semantic_retrieval_faiss.
+
+    query_dense: (n_queries, DIM) matrix, or a single (DIM,) vector
+    Returns one long-form frame with a query_id column (row number in
+    query_dense) and a 0-based rank per query.
+    rerank_factor > 0 re-ranks against df's full-precision dense vectors.
+    """
+    rerank_vectors = dense_matrix(df) if rerank_factor else None
+    idxs, dists = semantic_candidates_faiss(
+        index, query_dense, top_k,
+        rerank_vectors=rerank_vectors, rerank_factor=rerank_factor,
+        ef_search=ef_search,
+    )
+
+    # FAISS pads with -1 when fewer than top_k hits exist
+    valid = idxs >= 0
+    query_ids, ranks = np.nonzero(valid)
+    hit_idx = idxs[valid]
+
+    with stage("materialize"):
+        rows = take_rows(df, hit_idx)
+
+    out = pd.DataFrame({
+        "query_id": query_ids,
+        "rank": ranks,
+        "embedding_id": rows["embedding_id"].to_numpy(),
+        "article_id": rows["article_id"].to_numpy(),
+        "document": rows["document"].to_numpy(),
+        "lexical_score": None,
+        "cosine_similarity": dists[valid],
+        "metadata": rows["metadata"].to_numpy(),
+    })
+
+    return out
 
 
 def lexical_retrieval_exact(
@@ -71,6 +630,18 @@ def lexical_retrieval_exact(
     query_sparse: np.ndarray,
     top_k: int
 ) -> pd.DataFrame:
+    if isinstance(df, EmbeddingStore):
+        with stage("lexical.score"):
+            scores = -(df.sparse @ np.asarray(query_sparse, dtype=np.float32)) - 1
+        with stage("lexical.topk"):
+            idx = np.argsort(scores, kind="stable")[:top_k]
+
+        with stage("materialize"):
+            out = take_rows(df, idx)
+        out["lexical_score"] = scores[idx]
+        out["cosine_similarity"] = None
+        return out[RESULT_COLUMNS]
+
     scores = []
 
     for _, row in df.iterrows():
@@ -102,6 +673,61 @@ def hybrid_search_faiss(
     lexical = lexical_retrieval_exact(df, query_sparse, top_k_lexical)
     semantic = semantic_retrieval_faiss(df, index, query_dense, top_k_semantic)
 
-    return pd.concat([lexical, semantic], ignore_index=True)
+    with stage("concat"):
+        return pd.concat([lexical, semantic], ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the FAISS index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="build the index offline and write it to disk")
+    build.add_argument("--data", default="embedded_store",
+                       help="store directory or legacy embedded_data.pickle")
+    build.add_argument("--out", default="faiss_index")
+    build.add_argument("--m", type=int, default=M)
+    build.add_argument("--ef-construction", type=int, default=EF_CONSTRUCTION)
+    build.add_argument("--ef-search", type=int, default=EF_SEARCH)
+    build.add_argument("--index-type", choices=INDEX_TYPES, default="hnsw_flat")
+    build.add_argument("--nlist", type=int, default=NLIST)
+    build.add_argument("--pq-m", type=int, default=PQ_M)
+    build.add_argument("--nprobe", type=int, default=NPROBE)
+    build.add_argument("--rerank-factor", type=int, default=None)
+    build.add_argument("--recall-tolerance", type=float, default=None,
+                       help="fail if compressed recall@20 trails hnsw_flat by more")
+
+    tune = sub.add_parser("autotune", help="find the smallest efSearch per top_k meeting a recall target")
+    tune.add_argument("index_dir", nargs="?", default="faiss_index")
+    tune.add_argument("--data", default="embedded_store")
+    tune.add_argument("--recall", type=float, default=0.98)
+    tune.add_argument("--top-k", type=int, nargs="+", default=[10, 20, 50, 100])
+    tune.add_argument("--queries", type=int, default=500)
+    tune.add_argument("--queries-file", help="held-out query vectors (.npy)")
+
+    info = sub.add_parser("info", help="load an index and print its manifest")
+    info.add_argument("index_dir", nargs="?", default="faiss_index")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build_and_save(
+            args.data, args.out, args.m, args.ef_construction, args.ef_search,
+            index_type=args.index_type, nlist=args.nlist, pq_m=args.pq_m,
+            nprobe=args.nprobe, rerank_factor=args.rerank_factor,
+            recall_tolerance=args.recall_tolerance,
+        )
+    elif args.command == "autotune":
+        manifest = tune_and_save(
+            args.index_dir, args.data, args.recall, args.top_k,
+            args.queries, args.queries_file,
+        )
+        print(json.dumps(manifest["ef_search_by_top_k"], indent=2))
+    else:
+        t0 = time.time()
+        index, manifest = load_index(args.index_dir)
+        print(json.dumps(manifest, indent=2))
+        print(f"✓ Loaded {index.ntotal} vectors in {time.time() - t0:.2f}s")
 
 
+if __name__ == "__main__":
+    sys.exit(main())
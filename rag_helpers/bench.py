@@ -0,0 +1,250 @@
+"""
+Recall / latency benchmark for the retrieval paths.
+
+    python bench.py --sizes 10000 100000 --m 16 32 --ef-search 64 128 400
+    python bench.py --store embedded_store --queries 500
+
+Generates a synthetic corpus per size (or uses an existing store as-is),
+then reports per path: recall@k against the exact path, p50/p99 latency,
+QPS, index build time, index size and peak RSS, as JSON (--out).
+
+Exact references:
+    semantic_retrieval_faiss  vs semantic_retrieval (exact)
+    lexical_retrieval_fast    vs lexical_retrieval_exact
+    hybrid_search_*           vs exact lexical ∪ exact semantic
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import resource
+import numpy as np
+import pandas as pd
+import faiss
+from scipy.sparse import csr_matrix
+
+from store import EmbeddingStore, write_store
+from runner import (
+    normalize_rows,
+    format_sparse_string,
+    semantic_retrieval,
+    lexical_retrieval_fast,
+)
+from ann import (
+    M,
+    EF_CONSTRUCTION,
+    EF_SEARCH,
+    build_index,
+    load_dense_matrix,
+    set_search_params,
+    semantic_retrieval_faiss,
+    lexical_retrieval_exact,
+    hybrid_search_faiss,
+)
+from hybrid import hybrid_search_fused
+
+
+SPARSE_DIM = 995_300
+DENSE_DIM = 768
+
+
+def synthetic_store(n_docs: int, out_dir: str, dense_dim: int = DENSE_DIM,
+                    sparse_dim: int = SPARSE_DIM, terms_per_doc: int = 120,
+                    seed: int = 0) -> EmbeddingStore:
+    """Clustered dense vectors + Zipf-distributed sparse terms, written as a store."""
+    rng = np.random.default_rng(seed)
+
+    n_clusters = max(1, n_docs // 100)
+    centers = rng.standard_normal((n_clusters, dense_dim)).astype(np.float32)
+    dense = centers[rng.integers(0, n_clusters, n_docs)]
+    dense += 0.5 * rng.standard_normal((n_docs, dense_dim)).astype(np.float32)
+
+    nnz = rng.poisson(terms_per_doc, n_docs).clip(1)
+    indptr = np.concatenate([[0], np.cumsum(nnz)])
+    cols = (rng.zipf(1.3, indptr[-1]) - 1) % sparse_dim
+    vals = rng.random(indptr[-1]).astype(np.float32)
+    sparse = csr_matrix((vals, cols, indptr), shape=(n_docs, sparse_dim))
+    sparse.sum_duplicates()
+
+    df = pd.DataFrame({
+        "embedding_id": np.arange(n_docs),
+        "article_id": np.arange(n_docs) // 5,
+        "document": [f"doc {i}" for i in range(n_docs)],
+        "metadata": [{"chunk": int(i % 5)} for i in range(n_docs)],
+        "dense_embedding": list(dense),
+    })
+    write_store(df, out_dir, sparse)
+    return EmbeddingStore.open(out_dir)
+
+
+def make_queries(store: EmbeddingStore, n_queries: int, seed: int = 1):
+    """Perturbed corpus rows: (dense (n, DIM), sparse strings, sparse dense-width vectors)."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(store), min(n_queries, len(store)), replace=False)
+
+    dense = np.asarray(store.dense[rows], dtype=np.float32)
+    dense += 0.1 * rng.standard_normal(dense.shape).astype(np.float32)
+
+    sparse = store.sparse[rows]
+    sparse_strs = [
+        format_sparse_string(sparse[i].indices, sparse[i].data, sparse.shape[1])
+        for i in range(sparse.shape[0])
+    ]
+    return dense, sparse_strs, sparse
+
+
+def timed(fn, queries):
+    """Run fn per query; returns (results, latencies in seconds)."""
+    results, latencies = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(fn(q))
+        latencies.append(time.perf_counter() - t0)
+    return results, np.asarray(latencies)
+
+
+def latency_report(latencies: np.ndarray) -> dict:
+    return {
+        "p50_ms": float(np.percentile(latencies, 50) * 1e3),
+        "p99_ms": float(np.percentile(latencies, 99) * 1e3),
+        "mean_ms": float(latencies.mean() * 1e3),
+        "qps": float(len(latencies) / latencies.sum()) if latencies.sum() else None,
+    }
+
+
+def recall(results, truth) -> float:
+    """Mean |result ids ∩ truth ids| / |truth ids| over queries."""
+    hits, total = 0, 0
+    for r, t in zip(results, truth):
+        t = set(t["embedding_id"])
+        hits += len(t & set(r["embedding_id"]))
+        total += len(t)
+    return hits / total if total else 1.0
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def index_bytes(index: faiss.Index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def bench_corpus(store, args) -> dict:
+    top_k = args.top_k
+    q_dense, q_sparse_strs, q_sparse = make_queries(store, args.queries)
+    doc_sparse = store.sparse
+
+    t0 = time.perf_counter()
+    doc_normalized = normalize_rows(store.dense)
+    normalize_s = time.perf_counter() - t0
+
+    report = {"n_docs": len(store), "n_queries": len(q_dense), "top_k": top_k,
+              "normalize_s": normalize_s, "paths": {}, "faiss": []}
+
+    # exact references
+    sem_exact, lat = timed(
+        lambda q: semantic_retrieval(store, q, top_k, doc_normalized=doc_normalized), q_dense)
+    report["paths"]["semantic_retrieval"] = {**latency_report(lat), "recall": 1.0}
+
+    if not args.skip_lexical_exact:
+        lex_exact, lat = timed(
+            lambda i: lexical_retrieval_exact(store, q_sparse[i].toarray().ravel(), top_k),
+            range(len(q_dense)))
+        report["paths"]["lexical_retrieval_exact"] = {**latency_report(lat), "recall": 1.0}
+
+    lex_fast, lat = timed(
+        lambda s: lexical_retrieval_fast(store, doc_sparse, s, top_k), q_sparse_strs)
+    report["paths"]["lexical_retrieval_fast"] = {
+        **latency_report(lat),
+        "recall": recall(lex_fast, lex_exact) if not args.skip_lexical_exact else None,
+    }
+    if args.skip_lexical_exact:
+        lex_exact = lex_fast  # identical scores by construction
+
+    hybrid_truth = [pd.concat([a, b]) for a, b in zip(lex_exact, sem_exact)]
+
+    # FAISS sweep
+    dense = load_dense_matrix(store)
+    for m in args.m:
+        for ef_c in args.ef_construction:
+            t0 = time.perf_counter()
+            index = build_index(dense, m=m, ef_construction=ef_c)
+            build_s = time.perf_counter() - t0
+
+            for ef_s in args.ef_search:
+                set_search_params(index, "hnsw_flat", ef_search=ef_s)
+
+                # index bound as a default: it is deleted after each build
+                sem, lat = timed(
+                    lambda q, index=index: semantic_retrieval_faiss(store, index, q, top_k), q_dense)
+                entry = {
+                    "m": m, "ef_construction": ef_c, "ef_search": ef_s,
+                    "build_s": build_s, "index_bytes": index_bytes(index),
+                    "semantic_retrieval_faiss": {**latency_report(lat), "recall": recall(sem, sem_exact)},
+                }
+
+                if not args.skip_lexical_exact:
+                    hyb, lat = timed(
+                        lambda i, index=index: hybrid_search_faiss(
+                            store, index, q_sparse[i].toarray().ravel(), q_dense[i], top_k, top_k),
+                        range(len(q_dense)))
+                    entry["hybrid_search_faiss"] = {**latency_report(lat), "recall": recall(hyb, hybrid_truth)}
+
+                hyb, lat = timed(
+                    lambda i, index=index: hybrid_search_fused(
+                        store, doc_sparse, q_sparse_strs[i], q_dense[i], top_k, top_k, index=index),
+                    range(len(q_dense)))
+                entry["hybrid_search_fused"] = {**latency_report(lat), "recall": recall(hyb, hybrid_truth)}
+
+                report["faiss"].append(entry)
+                print(f"  M={m} efC={ef_c} efS={ef_s} "
+                      f"recall={entry['semantic_retrieval_faiss']['recall']:.4f} "
+                      f"p50={entry['semantic_retrieval_faiss']['p50_ms']:.2f}ms")
+
+            del index
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retrieval recall/latency benchmark")
+    parser.add_argument("--store", help="benchmark an existing store instead of synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000])
+    parser.add_argument("--dense-dim", type=int, default=DENSE_DIM)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--m", type=int, nargs="+", default=[M])
+    parser.add_argument("--ef-construction", type=int, nargs="+", default=[EF_CONSTRUCTION])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[64, 128, EF_SEARCH])
+    parser.add_argument("--skip-lexical-exact", action="store_true",
+                        help="skip the dense-width lexical reference (slow on big corpora)")
+    parser.add_argument("--out", default="bench_report.json")
+    args = parser.parse_args(argv)
+
+    report = {"args": vars(args), "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "faiss_version": faiss.__version__, "runs": []}
+
+    if args.store:
+        print(f"Benchmarking store {args.store}")
+        report["runs"].append(bench_corpus(EmbeddingStore.open(args.store), args))
+    else:
+        for n in args.sizes:
+            print(f"Benchmarking synthetic corpus n={n}")
+            with tempfile.TemporaryDirectory() as tmp:
+                store = synthetic_store(n, os.path.join(tmp, "store"), dense_dim=args.dense_dim)
+                report["runs"].append(bench_corpus(store, args))
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"✓ Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+Query-result cache for hybrid retrieval.
+
+Keys are a hash of the quantized query vectors (dense normalized and
+rounded to float16, sparse terms sorted with values rounded), the top-k
+values and the index version. Entries are evicted LRU once max_entries is
+reached and expire after ttl_s. When the index version changes (rebuild,
+upsert, delete) the whole cache is dropped.
+
+The corpus and index passed to the search are NOT hashed: the required
+version must identify them (corpus_hash, index directory, live.version),
+so give each corpus its own version or its own QueryCache.
+
+    cache = QueryCache(max_entries=10_000, ttl_s=3600)
+    search = CachedSearch(hybrid_search_faiss, cache, version=lambda: manifest["corpus_hash"])
+    results = search(df, index, query_sparse, query_dense, 50, 50)
+
+    # with IncrementalIndex: version=lambda: live.version
+    cache.stats()   # hits, misses, hit_rate, evictions, expirations, invalidations
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from runner import parse_sparse_string_fast
+
+
+MAX_ENTRIES = 10_000
+TTL_S = 3600.0
+SPARSE_DECIMALS = 4
+
+
+def quantize_dense(query_dense) -> bytes:
+    q = np.asarray(query_dense, dtype=np.float32).ravel()
+    norm = np.linalg.norm(q)
+    if norm > 0:
+        q = q / norm
+    return q.astype(np.float16).tobytes()
+
+
+def quantize_sparse(query_sparse) -> bytes:
+    """Accepts a '{k:v}/dim' string or a dense-width vector."""
+    if isinstance(query_sparse, str):
+        d, dim = parse_sparse_string_fast(query_sparse)
+        keys = np.fromiter(d.keys(), dtype=np.int64, count=len(d))
+        vals = np.fromiter(d.values(), dtype=np.float64, count=len(d))
+    else:
+        vec = np.asarray(query_sparse).ravel()
+        dim = len(vec)
+        keys = np.flatnonzero(vec)
+        vals = vec[keys].astype(np.float64)
+
+    order = np.argsort(keys)
+    vals = np.round(vals[order], SPARSE_DECIMALS)
+    return str(dim).encode() + keys[order].tobytes() + vals.tobytes()
+
+
+def query_key(query_sparse, query_dense, *top_ks, version=None) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(quantize_sparse(query_sparse) if query_sparse is not None else b"-")
+    h.update(quantize_dense(query_dense) if query_dense is not None else b"-")
+    h.update(repr((top_ks, version)).encode())
+    return h.hexdigest()
+
+
+class QueryCache:
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl_s: float = TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()  # key → (expires_at, value)
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def check_version(self, version) -> None:
+        """Drop everything when the index version moved."""
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._version = version
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+def _value_key(v):
+    if isinstance(v, (int, float, str, bool, type(None))):
+        return v
+    if isinstance(v, dict):
+        return tuple(sorted((k, _value_key(x)) for k, x in v.items()))
+    if isinstance(v, (list, tuple)):
+        return tuple(_value_key(x) for x in v)
+    # corpus objects (index, matrices) are identified by the version; id()
+    # is reused once an object is garbage collected
+    return type(v).__name__
+
+
+def _kwargs_key(kwargs: dict) -> tuple:
+    return tuple(sorted((k, _value_key(v)) for k, v in kwargs.items()))
+
+
+class CachedSearch:
+    """
+    Wraps a hybrid search function with signature
+    fn(df, index_or_matrix, query_sparse, query_dense, top_k_lexical, top_k_semantic, **kw)
+    (hybrid_search_faiss, hybrid_search_fused, ...).
+
+    version (required): the index version, or a callable returning it;
+    checked on every call so rebuilds / upserts invalidate the cache
+    automatically. It must differ between corpora sharing a cache.
+    """
+
+    def __init__(self, fn, cache: QueryCache = None, *, version):
+        if version is None:
+            raise ValueError("CachedSearch needs a version identifying the corpus and index")
+        self.fn = fn
+        self.cache = cache or QueryCache()
+        self.version = version if callable(version) else (lambda: version)
+
+    def __call__(self, df, index, query_sparse, query_dense, top_k_lexical, top_k_semantic, **kwargs):
+        version = self.version()
+        self.cache.check_version(version)
+
+        key = query_key(query_sparse, query_dense, top_k_lexical, top_k_semantic,
+                        _kwargs_key(kwargs), version=version)
+        hit = self.cache.get(key)
+        if hit is not None:
+            return hit.copy() if isinstance(hit, pd.DataFrame) else hit
+
+        result = self.fn(df, index, query_sparse, query_dense, top_k_lexical, top_k_semantic, **kwargs)
+        # callers get copies so they cannot mutate the cached frame
+        self.cache.put(key, result.copy() if isinstance(result, pd.DataFrame) else result)
+        return result
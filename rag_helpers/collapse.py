@@ -0,0 +1,175 @@
+"""
+Article-level collapse inside the top-k selection.
+
+Chunks of one article tend to fill most top-k slots. With collapse each
+leg keeps at most max_per_article rows per article_id while ranking, so a
+top_k request returns top_k rows from distinct articles (max_per_article=1)
+instead of being over-fetched and deduplicated in pandas afterwards.
+
+Candidates are ranked best first and walked in order; a row is kept while
+its article has fewer than max_per_article kept rows. When a ranked window
+does not yield top_k rows the window grows (x4) until it does or the
+corpus is exhausted, so the result equals a full-sort collapse.
+
+    codes = article_codes(store)          # once per corpus
+    hybrid_search_collapsed(store, store.sparse, query_sparse, query_dense,
+                            20, 20, codes, max_per_article=1, index=index)
+"""
+
+import numpy as np
+import pandas as pd
+import faiss
+from scipy.sparse import csr_matrix
+
+from store import take_rows, dense_matrix
+from runner import RESULT_COLUMNS, query_to_sparse_vector, normalize_rows
+from ann import search_params_for
+from hybrid import fuse_candidates, none_if_nan
+
+
+MIN_FETCH = 16
+GROWTH = 4
+
+
+def article_codes(source) -> np.ndarray:
+    """(n,) int64 article code per row (DataFrame or EmbeddingStore)."""
+    codes, _ = pd.factorize(np.asarray(source["article_id"]))
+    return codes.astype(np.int64)
+
+
+def collapse_ranked(idx, scores, codes: np.ndarray, top_k: int, max_per_article: int = 1):
+    """
+    First top_k of ranked candidates (best first) keeping at most
+    max_per_article rows per article.
+    """
+    idx = np.asarray(idx, dtype=np.int64)
+    c = codes[idx]
+
+    # position of each candidate within its article, in ranked order
+    order = np.argsort(c, kind="stable")
+    sc = c[order]
+    starts = np.r_[0, np.flatnonzero(sc[1:] != sc[:-1]) + 1]
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(sc)]))
+    rank = np.empty(len(c), dtype=np.int64)
+    rank[order] = np.arange(len(c)) - group_start
+
+    keep = np.flatnonzero(rank < max_per_article)[:top_k]
+    return idx[keep], np.asarray(scores)[keep]
+
+
+def collapse_scores(scores: np.ndarray, codes: np.ndarray, top_k: int, max_per_article: int = 1):
+    """Collapsed top_k over a full (n,) score vector, lower is better."""
+    n = len(scores)
+    if not n or top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    fetch = min(n, max(top_k * 2, MIN_FETCH))
+
+    while True:
+        part = np.argpartition(scores, fetch - 1)[:fetch] if fetch < n else np.arange(n)
+        part = part[np.lexsort((part, scores[part]))]
+
+        idx, s = collapse_ranked(part, scores[part], codes, top_k, max_per_article)
+        if len(idx) >= top_k or fetch >= n:
+            return idx, s
+        fetch = min(n, fetch * GROWTH)
+
+
+def lexical_candidates_collapsed(
+    doc_sparse_matrix: csr_matrix,
+    query_sparse_str: str,
+    top_k: int,
+    codes: np.ndarray,
+    max_per_article: int = 1,
+):
+    """(row idx, lexical_score), best first, at most max_per_article per article."""
+    query_vec = query_to_sparse_vector(query_sparse_str)
+
+    # pgvector <#> == negative inner product, EXACT SQL match
+    lexical_scores = -(doc_sparse_matrix @ query_vec.T).toarray().ravel() - 1
+
+    return collapse_scores(lexical_scores, codes, top_k, max_per_article)
+
+
+def semantic_candidates_collapsed(
+    query_dense: np.ndarray,
+    top_k: int,
+    codes: np.ndarray,
+    max_per_article: int = 1,
+    index: faiss.Index = None,
+    doc_normalized: np.ndarray = None,
+    ef_search=None,
+    block_size: int = 65536,
+):
+    """
+    (row idx, cosine distance), closest first, at most max_per_article per
+    article. Uses the FAISS index when given, exact scores over
+    doc_normalized otherwise.
+    """
+    q = np.array(query_dense, dtype="float32", ndmin=2, order="C")
+
+    if index is None:
+        if doc_normalized is None:
+            raise ValueError("semantic_candidates_collapsed needs an index or doc_normalized")
+        q = normalize_rows(q)[0]
+        n = doc_normalized.shape[0]
+        dists = np.empty(n, dtype=np.float64)
+        for start in range(0, n, block_size):
+            block = np.asarray(doc_normalized[start:start + block_size], dtype=np.float32)
+            dists[start:start + len(block)] = 1.0 - block @ q
+        return collapse_scores(dists, codes, top_k, max_per_article)
+
+    faiss.normalize_L2(q)
+    n = index.ntotal
+    if not n or top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    fetch = min(n, max(top_k * 2, MIN_FETCH))
+
+    while True:
+        sims, idx = index.search(q, fetch, params=search_params_for(index, ef_search, fetch))
+        valid = idx[0] >= 0
+        out_idx, out_dists = collapse_ranked(
+            idx[0][valid], 1 - sims[0][valid], codes, top_k, max_per_article)
+
+        # done: enough rows, whole index seen, or the index returned fewer than asked
+        if len(out_idx) >= top_k or fetch >= n or valid.sum() < fetch:
+            return out_idx, out_dists
+        fetch = min(n, fetch * GROWTH)
+
+
+def hybrid_search_collapsed(
+    df,
+    doc_sparse_matrix: csr_matrix,
+    query_sparse_str: str,
+    query_dense: np.ndarray,
+    top_k_lexical: int,
+    top_k_semantic: int,
+    codes: np.ndarray,
+    max_per_article: int = 1,
+    index: faiss.Index = None,
+    doc_normalized: np.ndarray = None,
+    ef_search=None,
+    union_all: bool = False,
+) -> pd.DataFrame:
+    """
+    hybrid_search_fused with each leg collapsed by article. The legs are
+    collapsed independently, so one article may appear once per leg.
+    Without an index the dense leg is exact over df's normalized vectors.
+    """
+    if index is None and doc_normalized is None:
+        doc_normalized = normalize_rows(dense_matrix(df))
+
+    lex_idx, lex_scores = lexical_candidates_collapsed(
+        doc_sparse_matrix, query_sparse_str, top_k_lexical, codes, max_per_article)
+    sem_idx, sem_dists = semantic_candidates_collapsed(
+        query_dense, top_k_semantic, codes, max_per_article,
+        index=index, doc_normalized=doc_normalized, ef_search=ef_search)
+
+    idx, lexical, cosine = fuse_candidates(lex_idx, lex_scores, sem_idx, sem_dists, union_all=union_all)
+
+    uniq, inv = np.unique(idx, return_inverse=True)
+    df_out = take_rows(df, uniq).iloc[inv].reset_index(drop=True)
+
+    df_out["lexical_score"] = none_if_nan(lexical)
+    df_out["cosine_similarity"] = none_if_nan(cosine)
+
+    return df_out[RESULT_COLUMNS]
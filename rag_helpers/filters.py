@@ -0,0 +1,244 @@
+"""
+Pre-filtering on article_id and metadata fields, pushed into both legs.
+
+FilterIndex keeps, per indexed field, the rows holding each value (an
+inverted index built once from the store). A filter such as
+
+    {"article_id": [12, 40], "source": "kb"}
+
+(values OR-ed within a field, fields AND-ed; list-valued metadata matches
+when any element matches) is compiled into one row bitmap per query:
+
+  * dense leg: the bitmap goes into FAISS as an IDSelectorBitmap, so HNSW
+    only returns allowed rows; when the filter keeps at most
+    EXACT_MAX_ROWS rows the allowed vectors are scored exactly instead
+    (cheaper, and HNSW recall degrades on very selective filters)
+  * lexical leg: only the allowed CSR rows are scored
+
+Both legs return a full top_k of allowed rows without over-fetching.
+
+    filter_index = FilterIndex.from_store(store, metadata_fields=["source"])
+    filter_index.save("filter_index")     # npy postings per field, loaded mmap
+    hybrid_search_filtered(store, store.sparse, index, query_sparse, query_dense,
+                           50, 50, filter_index.compile({"article_id": [12, 40]}),
+                           dense_vectors=store.dense)
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import faiss
+from scipy.sparse import csr_matrix
+
+from store import take_rows
+from runner import RESULT_COLUMNS, query_to_sparse_vector, exact_dense_search, normalize_rows
+from ann import selector_params
+from hybrid import fuse_candidates, none_if_nan
+
+
+EXACT_MAX_ROWS = 20_000
+
+FILTER_MANIFEST_FILE = "filter_index.json"
+
+
+class FilterIndex:
+
+    def __init__(self, n_rows: int, postings: dict):
+        self.n_rows = n_rows
+        # field → {value: sorted int32 row ids}
+        self.postings = postings
+
+    @classmethod
+    def from_store(cls, store, metadata_fields=(), index_article_id: bool = True) -> "FilterIndex":
+        """store: EmbeddingStore or DataFrame with article_id / metadata columns."""
+        postings = {}
+
+        if index_article_id:
+            values, inv = np.unique(np.asarray(store["article_id"]), return_inverse=True)
+            order = np.argsort(inv, kind="stable")
+            bounds = np.searchsorted(inv[order], np.arange(len(values) + 1))
+            postings["article_id"] = {
+                _hashable(v): order[bounds[i]:bounds[i + 1]].astype(np.int32)
+                for i, v in enumerate(values)
+            }
+
+        if metadata_fields:
+            metadata = np.asarray(store["metadata"])
+            for field in metadata_fields:
+                rows_by_value = {}
+                for row, meta in enumerate(metadata):
+                    if not isinstance(meta, dict) or field not in meta:
+                        continue
+                    value = meta[field]
+                    for v in (value if isinstance(value, (list, tuple, set)) else [value]):
+                        rows_by_value.setdefault(_hashable(v), []).append(row)
+                postings[field] = {
+                    v: np.asarray(rows, dtype=np.int32) for v, rows in rows_by_value.items()
+                }
+
+        return cls(len(store), postings)
+
+    @property
+    def fields(self) -> list:
+        return list(self.postings)
+
+    def rows(self, field: str, value) -> np.ndarray:
+        if field not in self.postings:
+            raise KeyError(f"Field {field!r} is not indexed (indexed: {self.fields})")
+        return self.postings[field].get(_hashable(value), np.empty(0, dtype=np.int32))
+
+    def compile(self, filters: dict) -> np.ndarray:
+        """(n_rows,) bool mask of the rows matching every field of filters."""
+        mask = np.ones(self.n_rows, dtype=bool)
+
+        for field, values in filters.items():
+            if not isinstance(values, (list, tuple, set, np.ndarray)):
+                values = [values]
+
+            field_mask = np.zeros(self.n_rows, dtype=bool)
+            for v in values:
+                field_mask[self.rows(field, v)] = True
+            mask &= field_mask
+
+        return mask
+
+    def save(self, out_dir: str) -> None:
+        """Per field: all row lists concatenated (rows.npy) and their offsets."""
+        os.makedirs(out_dir, exist_ok=True)
+
+        fields = []
+        for i, (field, by_value) in enumerate(self.postings.items()):
+            values = list(by_value)
+            lists = [by_value[v] for v in values]
+            offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+            np.cumsum([len(rows) for rows in lists], out=offsets[1:])
+            rows = np.concatenate(lists).astype(np.int32) if lists else np.empty(0, dtype=np.int32)
+
+            np.save(os.path.join(out_dir, f"field{i}_rows.npy"), rows)
+            np.save(os.path.join(out_dir, f"field{i}_offsets.npy"), offsets)
+            fields.append({"field": field, "values": values})
+
+        with open(os.path.join(out_dir, FILTER_MANIFEST_FILE), "w") as f:
+            json.dump({"n_rows": self.n_rows, "fields": fields}, f)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "FilterIndex":
+        with open(os.path.join(index_dir, FILTER_MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+
+        postings = {}
+        for i, entry in enumerate(manifest["fields"]):
+            rows = np.load(os.path.join(index_dir, f"field{i}_rows.npy"), mmap_mode="r")
+            offsets = np.load(os.path.join(index_dir, f"field{i}_offsets.npy"))
+            postings[entry["field"]] = {
+                # JSON turns tuples into lists
+                _hashable(tuple(v) if isinstance(v, list) else v): rows[offsets[j]:offsets[j + 1]]
+                for j, v in enumerate(entry["values"])
+            }
+        return cls(manifest["n_rows"], postings)
+
+
+def _hashable(v):
+    # numpy scalars → python, unhashable metadata values → their JSON text
+    if isinstance(v, np.generic):
+        return v.item()
+    try:
+        hash(v)
+        return v
+    except TypeError:
+        return json.dumps(v, sort_keys=True, default=str)
+
+
+def filter_params(index: faiss.Index, mask: np.ndarray, ef_search=None, top_k: int = 0):
+    """
+    SearchParameters restricting index.search to rows where mask is True;
+    HNSW / IVF params of the index's type, its own efSearch when ef_search is None.
+    """
+    bitmap = np.packbits(mask, bitorder="little")  # bit i == row i allowed
+    sel = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+
+    params = selector_params(index, sel, ef_search=ef_search, top_k=top_k)
+    # the selector and its buffer must outlive the search call
+    params._sel_ref = (sel, bitmap)
+    return params
+
+
+def semantic_candidates_filtered(
+    index: faiss.Index,
+    query_dense: np.ndarray,
+    top_k: int,
+    mask: np.ndarray,
+    dense_vectors: np.ndarray = None,
+    ef_search=None,
+    exact_max_rows: int = EXACT_MAX_ROWS,
+):
+    """
+    (row idx, cosine distance) for one query over the allowed rows only.
+    dense_vectors (e.g. store.dense) enables the exact path for selective filters.
+    """
+    allowed = np.flatnonzero(mask)
+    if not len(allowed):
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    if dense_vectors is not None and len(allowed) <= exact_max_rows:
+        idx, dists = exact_dense_search(normalize_rows(dense_vectors[allowed]), query_dense, top_k)
+        return allowed[idx[0]], dists[0]
+
+    q = np.array(query_dense, dtype="float32", ndmin=2, order="C")
+    faiss.normalize_L2(q)
+
+    sims, idx = index.search(q, top_k, params=filter_params(index, mask, ef_search, top_k))
+    valid = idx[0] >= 0
+    return idx[0][valid], 1 - sims[0][valid]
+
+
+def lexical_candidates_filtered(
+    doc_sparse_matrix: csr_matrix,
+    query_sparse_str: str,
+    top_k: int,
+    mask: np.ndarray,
+):
+    """(row idx, lexical_score) for one query, scoring only the allowed rows."""
+    allowed = np.flatnonzero(mask)
+    query_vec = query_to_sparse_vector(query_sparse_str)
+
+    # CSR row gather: cost follows the filter's selectivity
+    sub = doc_sparse_matrix if len(allowed) == mask.size else doc_sparse_matrix[allowed]
+
+    # pgvector <#> == negative inner product, EXACT SQL match
+    lexical_scores = -(sub @ query_vec.T).toarray().ravel() - 1
+
+    order = np.argsort(lexical_scores, kind="stable")[:top_k]
+    return allowed[order], lexical_scores[order]
+
+
+def hybrid_search_filtered(
+    df,
+    doc_sparse_matrix: csr_matrix,
+    index: faiss.Index,
+    query_sparse_str: str,
+    query_dense: np.ndarray,
+    top_k_lexical: int,
+    top_k_semantic: int,
+    mask: np.ndarray,
+    dense_vectors: np.ndarray = None,
+    ef_search=None,
+    union_all: bool = False,
+) -> pd.DataFrame:
+    """hybrid_search_fused restricted to rows where mask is True."""
+    lex_idx, lex_scores = lexical_candidates_filtered(
+        doc_sparse_matrix, query_sparse_str, top_k_lexical, mask)
+    sem_idx, sem_dists = semantic_candidates_filtered(
+        index, query_dense, top_k_semantic, mask,
+        dense_vectors=dense_vectors, ef_search=ef_search)
+
+    idx, lexical, cosine = fuse_candidates(lex_idx, lex_scores, sem_idx, sem_dists, union_all=union_all)
+
+    uniq, inv = np.unique(idx, return_inverse=True)
+    df_out = take_rows(df, uniq).iloc[inv].reset_index(drop=True)
+
+    df_out["lexical_score"] = none_if_nan(lexical)
+    df_out["cosine_similarity"] = none_if_nan(cosine)
+
+    return df_out[RESULT_COLUMNS]
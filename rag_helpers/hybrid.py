@@ -0,0 +1,140 @@
+"""
+Single-pass fused hybrid retrieval.
+
+Both legs only return (row idx, score) candidates. They are merged and
+deduplicated by row (one row per embedding_id) keeping both scores, and
+document/metadata are gathered once, for the final rows only.
+
+union_all=True keeps the old hybrid_search_faiss layout (lexical rows then
+semantic rows, duplicates kept, each row carrying only its own leg's
+score) while still materializing every distinct row once.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from store import take_rows, dense_matrix
+from runner import RESULT_COLUMNS, lexical_candidates, exact_dense_search, normalize_rows
+from ann import semantic_candidates_faiss
+from profiling import stage, candidates
+
+
+def hybrid_candidates(
+    doc_sparse_matrix: csr_matrix,
+    query_sparse_str: str,
+    query_dense: np.ndarray,
+    top_k_lexical: int,
+    top_k_semantic: int,
+    index=None,
+    doc_normalized: np.ndarray = None,
+    rerank_vectors: np.ndarray = None,
+    rerank_factor: int = 0,
+    ef_search=None,
+):
+    """
+    Runs both legs without touching row data.
+    Dense leg uses the FAISS index when given, exact search over
+    doc_normalized otherwise; rerank_vectors / rerank_factor / ef_search go
+    to semantic_candidates_faiss.
+    Returns (lex_idx, lex_scores, sem_idx, sem_dists).
+    """
+    if index is None and doc_normalized is None:
+        raise ValueError("hybrid_candidates needs an index or doc_normalized for the dense leg")
+
+    lex_idx, lex_scores = lexical_candidates(doc_sparse_matrix, query_sparse_str, top_k_lexical)
+
+    if index is not None:
+        sem_idx, sem_dists = semantic_candidates_faiss(
+            index, query_dense, top_k_semantic,
+            rerank_vectors=rerank_vectors, rerank_factor=rerank_factor, ef_search=ef_search,
+        )
+    else:
+        with stage("semantic.exact"):
+            sem_idx, sem_dists = exact_dense_search(doc_normalized, query_dense, top_k_semantic)
+
+    sem_idx, sem_dists = sem_idx[0], sem_dists[0]
+    valid = sem_idx >= 0
+
+    return lex_idx, lex_scores, sem_idx[valid], sem_dists[valid]
+
+
+def fuse_candidates(lex_idx, lex_scores, sem_idx, sem_dists, union_all: bool = False):
+    """
+    Returns (idx, lexical_score, cosine_similarity) arrays, NaN where a row
+    was not returned by that leg.
+
+    Default: one entry per row, lexical order first, then semantic-only
+    rows in semantic order; rows found by both legs carry both scores.
+    """
+    n_lex = len(lex_idx)
+    all_idx = np.concatenate([lex_idx, sem_idx]).astype(np.int64)
+
+    lexical = np.full(len(all_idx), np.nan)
+    cosine = np.full(len(all_idx), np.nan)
+    lexical[:n_lex] = lex_scores
+    cosine[n_lex:] = sem_dists
+
+    if union_all:
+        return all_idx, lexical, cosine
+
+    # first occurrence of each row keeps its position
+    uniq, first, inv = np.unique(all_idx, return_index=True, return_inverse=True)
+
+    fused_lexical = np.full(len(uniq), np.nan)
+    fused_cosine = np.full(len(uniq), np.nan)
+    fused_lexical[inv[:n_lex]] = lex_scores
+    fused_cosine[inv[n_lex:]] = sem_dists
+
+    order = np.argsort(first, kind="stable")
+    return uniq[order], fused_lexical[order], fused_cosine[order]
+
+
+def hybrid_search_fused(
+    df,
+    doc_sparse_matrix: csr_matrix,
+    query_sparse_str: str,
+    query_dense: np.ndarray,
+    top_k_lexical: int,
+    top_k_semantic: int,
+    index=None,
+    doc_normalized: np.ndarray = None,
+    union_all: bool = False,
+    rerank_factor: int = 0,
+    ef_search=None,
+) -> pd.DataFrame:
+    """
+    rerank_factor > 0 re-ranks the dense leg against df's full-precision vectors.
+    Without an index the dense leg is exact over df's normalized vectors.
+    """
+    if index is None and doc_normalized is None:
+        doc_normalized = normalize_rows(dense_matrix(df))
+
+    lex_idx, lex_scores, sem_idx, sem_dists = hybrid_candidates(
+        doc_sparse_matrix, query_sparse_str, query_dense,
+        top_k_lexical, top_k_semantic,
+        index=index, doc_normalized=doc_normalized,
+        rerank_vectors=dense_matrix(df) if rerank_factor else None,
+        rerank_factor=rerank_factor, ef_search=ef_search,
+    )
+
+    with stage("fuse"):
+        idx, lexical, cosine = fuse_candidates(
+            lex_idx, lex_scores, sem_idx, sem_dists, union_all=union_all
+        )
+    candidates("fuse", len(idx))
+
+    # materialize each distinct row once, then expand (union_all repeats rows)
+    with stage("materialize"):
+        uniq, inv = np.unique(idx, return_inverse=True)
+        df_out = take_rows(df, uniq).iloc[inv].reset_index(drop=True)
+
+    df_out["lexical_score"] = none_if_nan(lexical)
+    df_out["cosine_similarity"] = none_if_nan(cosine)
+
+    return df_out[RESULT_COLUMNS]
+
+
+def none_if_nan(values: np.ndarray) -> np.ndarray:
+    # keep the None convention of the single-leg retrieval functions
+    return np.where(np.isnan(values), None, values)
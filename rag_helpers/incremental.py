@@ -0,0 +1,487 @@
+"""
+Incremental upsert / delete keyed by embedding_id.
+
+The FAISS index and the sparse CSR matrix share one position space:
+
+    position 0 .. n_base-1   rows of the base EmbeddingStore (built offline)
+    position n_base ..       rows added by upsert(), in arrival order
+
+ids[position] is the embedding_id stored there and id_to_pos points at the
+live position of every embedding_id. An update appends the new version and
+tombstones the old position; a delete only tombstones. Tombstoned
+positions are filtered inside FAISS with an IDSelectorBitmap and masked
+out of the lexical scores, so no rebuild is needed until compaction.
+
+Ingestion cost is proportional to the delta: only the new vectors are
+added to HNSW and only the new sparse rows are parsed. compact() (or
+compact_async()) rebuilds everything from the live rows, replays the
+operations that arrived meanwhile, and swaps the new state in. Reads run
+against a snapshot() of that state, so the positions a search returns are
+resolved to rows of the same state, and searches only exclude index.add.
+
+    index, manifest = load_index("faiss_index", mmap=False)   # must be writable
+    live = IncrementalIndex.from_store(store, index, manifest)
+    live.upsert(new_rows_df)          # embedding_id, article_id, document,
+                                      # metadata, dense_embedding, sparse_embedding
+    live.delete([123, 456])
+    live.hybrid_search(query_sparse_str, query_dense, 50, 50)
+"""
+
+import os
+import re
+import json
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import faiss
+from scipy.sparse import csr_matrix, vstack
+
+from store import EmbeddingStore, META_COLUMNS
+from runner import RESULT_COLUMNS, build_sparse_matrix_bulk, query_to_sparse_vector, normalize_rows
+from ann import M, EF_CONSTRUCTION, EF_SEARCH, NLIST, PQ_M, NPROBE, build_index, search_params_for
+
+
+COMPACT_DEAD_FRACTION = 0.2  # compact once this share of positions is dead
+
+STATE_FILE = "incremental_state.npz"
+DELTA_META_FILE = "delta_meta.pkl"
+INDEX_FILE = "index.faiss"
+
+
+class IncrementalIndex:
+
+    def __init__(self, store: EmbeddingStore, index: faiss.Index, ids: np.ndarray = None,
+                 manifest: dict = None):
+        self.store = store
+        self.index = index
+        # index_type and build params, reused when compaction rebuilds the index
+        self.manifest = dict(manifest) if manifest else _infer_manifest(index)
+        self.n_base = len(store)
+
+        self.ids = np.asarray(store["embedding_id"] if ids is None else ids, dtype=np.int64)
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.id_to_pos = {int(e): i for i, e in enumerate(self.ids)}
+
+        # rows appended since the base store was written
+        self._delta_dense = []
+        self._delta_sparse = []
+        self._delta_meta = []
+        self._delta_sparse_matrix = None
+        self._delta_meta_frame = None
+
+        self._bitmap = None
+        self._lock = threading.RLock()
+        # searches share the index, index.add needs it alone; swapped with the index
+        self._index_lock = _ReadWriteLock()
+        self._log = None  # operations recorded while a compaction runs
+        self._compaction = None
+
+        self.version = 0
+
+    @classmethod
+    def from_store(cls, store: EmbeddingStore, index: faiss.Index,
+                   manifest: dict = None) -> "IncrementalIndex":
+        if index.ntotal != len(store):
+            raise ValueError(f"Index has {index.ntotal} vectors, store has {len(store)} rows")
+        return cls(store, index, manifest=manifest)
+
+    def __len__(self) -> int:
+        return int(self.alive.sum())
+
+    @property
+    def dead_fraction(self) -> float:
+        return 1.0 - len(self) / len(self.ids) if len(self.ids) else 0.0
+
+    # ---------------- writes ----------------
+
+    def upsert(self, rows: pd.DataFrame) -> None:
+        """Add new embedding_ids, replace existing ones (old version tombstoned)."""
+        rows = rows.drop_duplicates("embedding_id", keep="last").reset_index(drop=True)
+        if rows.empty:
+            return
+
+        dense = normalize_rows(np.vstack(rows["dense_embedding"].values))
+        sparse = build_sparse_matrix_bulk(rows["sparse_embedding"]).astype(np.float32)
+        meta = rows[META_COLUMNS].copy()
+
+        with self._lock:
+            if sparse.shape[1] != self.store.sparse.shape[1]:
+                raise ValueError("Sparse dimension mismatch")
+
+            self._tombstone(rows["embedding_id"].values)
+
+            start = len(self.ids)
+            with self._index_lock.write():
+                self.index.add(dense)
+
+            new_ids = rows["embedding_id"].to_numpy(dtype=np.int64)
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.alive = np.concatenate([self.alive, np.ones(len(rows), dtype=bool)])
+            for offset, e in enumerate(new_ids):
+                self.id_to_pos[int(e)] = start + offset
+
+            self._delta_dense.append(dense)
+            self._delta_sparse.append(sparse)
+            self._delta_meta.append(meta)
+            self._delta_sparse_matrix = None
+            self._delta_meta_frame = None
+            self._bitmap = None
+            self.version += 1
+
+            if self._log is not None:
+                self._log.append(("upsert", rows))
+
+    def delete(self, embedding_ids) -> None:
+        with self._lock:
+            self._tombstone(embedding_ids)
+            self.version += 1
+
+            if self._log is not None:
+                self._log.append(("delete", list(embedding_ids)))
+
+    def _tombstone(self, embedding_ids) -> None:
+        # copy on write: read snapshots keep the mask they started with
+        alive = self.alive.copy()
+        for e in embedding_ids:
+            pos = self.id_to_pos.pop(int(e), None)
+            if pos is not None:
+                alive[pos] = False
+        self.alive = alive
+        self._bitmap = None
+
+    # ---------------- reads ----------------
+
+    def snapshot(self) -> "_Snapshot":
+        """
+        Consistent view for one read. Positions found through it stay valid
+        for its take() even if a compaction swaps the state in meanwhile.
+        """
+        with self._lock:
+            if self._bitmap is None:
+                # bit i of the bitmap == position i is searchable
+                self._bitmap = np.packbits(self.alive, bitorder="little")
+            if self._delta_meta_frame is None and self._delta_meta:
+                self._delta_meta_frame = pd.concat(self._delta_meta, ignore_index=True)
+            return _Snapshot(
+                store=self.store, index=self.index, index_lock=self._index_lock,
+                manifest=self.manifest, n_base=self.n_base, alive=self.alive,
+                bitmap=self._bitmap, delta_sparse=self.delta_sparse(),
+                delta_meta=self._delta_meta_frame,
+            )
+
+    def dense_candidates(self, query_dense: np.ndarray, top_k: int, ef_search=None,
+                         snapshot: "_Snapshot" = None):
+        """(positions, cosine distances) for one query, tombstones excluded."""
+        return (snapshot or self.snapshot()).dense_candidates(query_dense, top_k, ef_search)
+
+    def delta_sparse(self) -> csr_matrix:
+        if self._delta_sparse_matrix is None:
+            dim = self.store.sparse.shape[1]
+            blocks = self._delta_sparse or [csr_matrix((0, dim), dtype=np.float32)]
+            self._delta_sparse_matrix = vstack(blocks, format="csr")
+        return self._delta_sparse_matrix
+
+    def lexical_candidates(self, query_sparse_str: str, top_k: int, snapshot: "_Snapshot" = None):
+        """(positions, lexical_score) for one query, tombstones excluded."""
+        return (snapshot or self.snapshot()).lexical_candidates(query_sparse_str, top_k)
+
+    def take(self, positions, snapshot: "_Snapshot" = None) -> pd.DataFrame:
+        """Row data for positions (base rows from the store, new rows from the delta)."""
+        return (snapshot or self.snapshot()).take(positions)
+
+    def semantic_retrieval(self, query_dense, top_k: int, ef_search=None) -> pd.DataFrame:
+        snap = self.snapshot()
+        pos, dist = snap.dense_candidates(query_dense, top_k, ef_search)
+        out = snap.take(pos)
+        out["lexical_score"] = None
+        out["cosine_similarity"] = dist
+        return out[RESULT_COLUMNS]
+
+    def lexical_retrieval(self, query_sparse_str: str, top_k: int) -> pd.DataFrame:
+        snap = self.snapshot()
+        pos, scores = snap.lexical_candidates(query_sparse_str, top_k)
+        out = snap.take(pos)
+        out["lexical_score"] = scores
+        out["cosine_similarity"] = None
+        return out[RESULT_COLUMNS]
+
+    def hybrid_search(self, query_sparse_str, query_dense, top_k_lexical, top_k_semantic,
+                      ef_search=None) -> pd.DataFrame:
+        # UNION ALL, like hybrid_search_faiss
+        return pd.concat([
+            self.lexical_retrieval(query_sparse_str, top_k_lexical),
+            self.semantic_retrieval(query_dense, top_k_semantic, ef_search),
+        ], ignore_index=True)
+
+    # ---------------- compaction ----------------
+
+    def _live_vectors(self, positions: np.ndarray) -> np.ndarray:
+        base = positions[positions < self.n_base]
+        parts = [normalize_rows(self.store.dense[base])] if len(base) else []
+        if self._delta_dense:
+            delta = np.concatenate(self._delta_dense)
+            parts.append(delta[positions[positions >= self.n_base] - self.n_base])
+        return np.concatenate(parts) if parts else np.empty((0, self.index.d), dtype=np.float32)
+
+    def _live_sparse(self, positions: np.ndarray) -> csr_matrix:
+        base = self.store.sparse[positions[positions < self.n_base]]
+        delta = self.delta_sparse()[positions[positions >= self.n_base] - self.n_base]
+        return vstack([base.astype(np.float32), delta], format="csr")
+
+    def compact(self, m: int = None, ef_construction: int = None, out_dir: str = None) -> None:
+        """
+        Rebuild index + CSR from live rows only. Reads happen outside the
+        lock; writes that arrive meanwhile are logged and replayed.
+        The index is rebuilt with the index_type and build params of the
+        manifest; m / ef_construction override them.
+        The compacted rows are written as a new store in out_dir (default:
+        <store path>.compact<version> next to the current store).
+        """
+        with self._lock:
+            if self._log is not None:
+                raise RuntimeError("Compaction already running")
+            self._log = []
+            live = np.flatnonzero(self.alive)
+            ids = self.ids[live]
+            if out_dir is None:
+                base = re.sub(r"\.compact\d+$", "", os.path.abspath(self.store.path))
+                out_dir = f"{base}.compact{self.version + 1}"
+            manifest = dict(self.manifest)
+        if m is not None:
+            manifest["m"] = m
+        if ef_construction is not None:
+            manifest["ef_construction"] = ef_construction
+
+        try:
+            dense = self._live_vectors(live)
+            sparse = self._live_sparse(live)
+            meta = self.take(live)
+
+            index = build_index(
+                dense, manifest.get("m", M), manifest.get("ef_construction", EF_CONSTRUCTION),
+                manifest.get("ef_search", EF_SEARCH),
+                index_type=manifest.get("index_type", "hnsw_flat"),
+                nlist=manifest.get("nlist", NLIST), pq_m=manifest.get("pq_m", PQ_M),
+                nprobe=manifest.get("nprobe", NPROBE),
+            )
+            manifest["n_vectors"] = int(len(dense))
+            manifest.pop("corpus_hash", None)
+            store = _write_compacted_store(meta, dense, sparse, out_dir)
+        except Exception:
+            with self._lock:
+                self._log = None
+            raise
+
+        with self._lock:
+            log, self._log = self._log, None
+
+            fresh = IncrementalIndex(store, index, ids, manifest)
+            for op, payload in log:
+                if op == "upsert":
+                    fresh.upsert(payload)
+                else:
+                    fresh.delete(payload)
+
+            # swap in place so existing references see the compacted state;
+            # keep our lock, other threads may be waiting on it
+            lock, version = self._lock, self.version
+            self.__dict__.update(fresh.__dict__)
+            self._lock = lock
+            self.version = version + 1
+
+    def compact_async(self, **kwargs) -> threading.Thread:
+        t = threading.Thread(target=self.compact, kwargs=kwargs, daemon=True)
+        t.start()
+        self._compaction = t
+        return t
+
+    def maybe_compact(self, threshold: float = COMPACT_DEAD_FRACTION):
+        if self.dead_fraction >= threshold and self._log is None:
+            return self.compact_async()
+        return None
+
+    # ---------------- persistence ----------------
+
+    def save(self, out_dir: str) -> None:
+        """Persist index + id map + delta so a restart does not lose upserts."""
+        os.makedirs(out_dir, exist_ok=True)
+        with self._lock:
+            faiss.write_index(self.index, os.path.join(out_dir, INDEX_FILE))
+            delta = self.delta_sparse()
+            np.savez(
+                os.path.join(out_dir, STATE_FILE),
+                ids=self.ids, alive=self.alive,
+                delta_dense=(np.concatenate(self._delta_dense) if self._delta_dense
+                             else np.empty((0, self.index.d), dtype=np.float32)),
+                delta_indptr=delta.indptr, delta_indices=delta.indices, delta_data=delta.data,
+            )
+            meta = (pd.concat(self._delta_meta, ignore_index=True) if self._delta_meta
+                    else pd.DataFrame(columns=META_COLUMNS))
+            meta.to_pickle(os.path.join(out_dir, DELTA_META_FILE))
+            with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+                json.dump({"store": os.path.abspath(self.store.path), "version": self.version,
+                           "n_positions": int(len(self.ids)), "n_live": len(self),
+                           "index": self.manifest}, f, indent=2)
+
+    @classmethod
+    def load(cls, state_dir: str, store: EmbeddingStore = None) -> "IncrementalIndex":
+        with open(os.path.join(state_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        store = store or EmbeddingStore.open(manifest["store"])
+
+        index = faiss.read_index(os.path.join(state_dir, INDEX_FILE))
+        state = np.load(os.path.join(state_dir, STATE_FILE))
+
+        live = cls(store, index, state["ids"][:len(store)], manifest.get("index"))
+        live.ids = state["ids"]
+        live.alive = state["alive"]
+        live.id_to_pos = {int(live.ids[p]): int(p) for p in np.flatnonzero(live.alive)}
+
+        if len(state["delta_dense"]):
+            live._delta_dense = [state["delta_dense"]]
+            live._delta_sparse = [csr_matrix(
+                (state["delta_data"], state["delta_indices"], state["delta_indptr"]),
+                shape=(len(state["delta_dense"]), store.sparse.shape[1]),
+            )]
+            live._delta_meta = [pd.read_pickle(os.path.join(state_dir, DELTA_META_FILE))]
+
+        live.version = manifest["version"]
+        return live
+
+
+class _ReadWriteLock:
+    """Any number of readers, or one writer; waiting writers go first."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """The state one read runs against (see IncrementalIndex.snapshot)."""
+
+    store: EmbeddingStore
+    index: faiss.Index
+    index_lock: _ReadWriteLock
+    manifest: dict
+    n_base: int
+    alive: np.ndarray
+    bitmap: np.ndarray
+    delta_sparse: csr_matrix
+    delta_meta: pd.DataFrame
+
+    def search_params(self, ef_search, top_k):
+        """Per-call search params of the index type, with the tombstone selector."""
+        if self.manifest.get("index_type", "hnsw_flat").startswith("ivf"):
+            params = faiss.SearchParametersIVF(nprobe=int(self.manifest.get("nprobe") or NPROBE))
+        else:
+            if ef_search is None:
+                ef_search = (self.manifest.get("ef_search_by_top_k")
+                             or self.manifest.get("ef_search") or EF_SEARCH)
+            params = search_params_for(self.index, ef_search, top_k) or faiss.SearchParameters()
+
+        # positions added after this snapshot fall outside the bitmap
+        sel = faiss.IDSelectorBitmap(len(self.alive), faiss.swig_ptr(self.bitmap))
+        params.sel = sel
+        # the selector must outlive the search call
+        params._sel_ref = (sel, self.bitmap)
+        return params
+
+    def dense_candidates(self, query_dense: np.ndarray, top_k: int, ef_search=None):
+        q = np.array(query_dense, dtype="float32", ndmin=2, order="C")
+        faiss.normalize_L2(q)
+
+        params = self.search_params(ef_search, top_k)
+        with self.index_lock.read():
+            sims, pos = self.index.search(q, top_k, params=params)
+
+        valid = pos[0] >= 0
+        return pos[0][valid], 1 - sims[0][valid]
+
+    def lexical_candidates(self, query_sparse_str: str, top_k: int):
+        query_vec = query_to_sparse_vector(query_sparse_str).T
+
+        # pgvector <#> == negative inner product, EXACT SQL match
+        scores = np.concatenate([
+            (self.store.sparse @ query_vec).toarray().ravel(),
+            (self.delta_sparse @ query_vec).toarray().ravel(),
+        ])
+        lexical_scores = -scores - 1
+        lexical_scores[~self.alive[:len(lexical_scores)]] = np.inf
+
+        idx = np.argsort(lexical_scores, kind="stable")[:top_k]
+        idx = idx[np.isfinite(lexical_scores[idx])]
+        return idx, lexical_scores[idx]
+
+    def take(self, positions) -> pd.DataFrame:
+        positions = np.asarray(positions, dtype=np.int64)
+        out = pd.DataFrame(index=range(len(positions)), columns=META_COLUMNS, dtype=object)
+
+        base = positions < self.n_base
+        if base.any():
+            out.loc[base, META_COLUMNS] = self.store.take(positions[base]).to_numpy()
+        if (~base).any():
+            out.loc[~base, META_COLUMNS] = self.delta_meta.iloc[positions[~base] - self.n_base].to_numpy()
+
+        return out
+
+
+def _write_compacted_store(meta, dense, sparse, out_dir):
+    from store import write_store
+
+    frame = meta.copy()
+    frame["dense_embedding"] = list(dense)
+    write_store(frame, out_dir, sparse)
+    return EmbeddingStore.open(out_dir)
+
+
+def _infer_manifest(index: faiss.Index) -> dict:
+    """Build params of an index loaded without its manifest."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return {"index_type": "ivf_pq", "nlist": index.nlist, "pq_m": index.pq.M,
+                "nprobe": index.nprobe}
+
+    manifest = {"index_type": "hnsw_flat"}
+    if hasattr(index, "hnsw"):
+        manifest.update({"m": index.hnsw.nb_neighbors(1),
+                         "ef_construction": index.hnsw.efConstruction,
+                         "ef_search": index.hnsw.efSearch})
+    if isinstance(index, faiss.IndexHNSWSQ):
+        qtype = faiss.downcast_index(index.storage).sq.qtype
+        manifest["index_type"] = "hnsw_fp16" if qtype == faiss.ScalarQuantizer.QT_fp16 else "hnsw_sq8"
+    return manifest
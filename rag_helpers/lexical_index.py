@@ -0,0 +1,216 @@
+"""
+Inverted-index lexical engine with MaxScore top-k pruning.
+
+Same results as lexical_retrieval_fast (pgvector <#>, lexical_score =
+-(ip) - 1) but without scoring every document:
+
+    postings[t]    doc ids containing term t (sorted) + their impacts
+    max_impact[t]  largest impact in postings[t]
+
+Query terms are processed in decreasing upper bound (weight * max_impact).
+Once the k-th best partial score beats the summed upper bounds of the
+remaining terms, those terms are non-essential: documents that only
+appear in their postings can never reach the top-k, so they are only
+used to finish scoring the candidates already found, and candidates that
+cannot reach the threshold any more are dropped.
+
+Cost is proportional to the postings actually touched, not corpus size.
+
+Requires non-negative impacts and query weights (SPLADE-style sparse
+vectors); other queries fall back to an exhaustive postings scan.
+
+    lexical_index = LexicalIndex.from_sparse(store.sparse)
+    lexical_index.save("lexical_index")        # once
+    lexical_index = LexicalIndex.load("lexical_index")
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from store import take_rows
+from runner import RESULT_COLUMNS, query_to_sparse_vector
+
+
+POSTINGS_DOCS_FILE = "postings_docs.npy"
+POSTINGS_IMPACTS_FILE = "postings_impacts.npy"
+POSTINGS_INDPTR_FILE = "postings_indptr.npy"
+MAX_IMPACT_FILE = "max_impact.npy"
+MANIFEST_FILE = "manifest.json"
+
+
+class LexicalIndex:
+
+    def __init__(self, indptr, doc_ids, impacts, max_impact, n_docs):
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.impacts = impacts
+        self.max_impact = max_impact
+        self.n_docs = n_docs
+        self.non_negative = bool(impacts.size == 0 or impacts.min() >= 0)
+
+    @classmethod
+    def from_sparse(cls, doc_sparse_matrix: csr_matrix) -> "LexicalIndex":
+        # CSC == term → postings; sorted doc ids inside each term
+        csc = doc_sparse_matrix.tocsc()
+        csc.sum_duplicates()
+        csc.sort_indices()
+
+        indptr = csc.indptr.astype(np.int64)
+        impacts = csc.data.astype(np.float32)
+
+        max_impact = np.zeros(csc.shape[1], dtype=np.float32)
+        nonempty = np.flatnonzero(np.diff(indptr))
+        if nonempty.size:
+            max_impact[nonempty] = np.maximum.reduceat(impacts, indptr[nonempty])
+
+        return cls(indptr, csc.indices.astype(np.int32), impacts, max_impact, csc.shape[0])
+
+    def save(self, out_dir: str) -> None:
+        os.makedirs(out_dir, exist_ok=True)
+        np.save(os.path.join(out_dir, POSTINGS_INDPTR_FILE), self.indptr)
+        np.save(os.path.join(out_dir, POSTINGS_DOCS_FILE), self.doc_ids)
+        np.save(os.path.join(out_dir, POSTINGS_IMPACTS_FILE), self.impacts)
+        np.save(os.path.join(out_dir, MAX_IMPACT_FILE), self.max_impact)
+
+        with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+            json.dump({"n_docs": self.n_docs, "n_terms": len(self.max_impact),
+                       "n_postings": int(self.doc_ids.size)}, f, indent=2)
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "LexicalIndex":
+        mode = "r" if mmap else None
+
+        with open(os.path.join(index_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+
+        return cls(
+            np.load(os.path.join(index_dir, POSTINGS_INDPTR_FILE), mmap_mode=mode),
+            np.load(os.path.join(index_dir, POSTINGS_DOCS_FILE), mmap_mode=mode),
+            np.load(os.path.join(index_dir, POSTINGS_IMPACTS_FILE), mmap_mode=mode),
+            np.load(os.path.join(index_dir, MAX_IMPACT_FILE), mmap_mode=mode),
+            manifest["n_docs"],
+        )
+
+    def postings(self, term: int):
+        lo, hi = self.indptr[term], self.indptr[term + 1]
+        return self.doc_ids[lo:hi], self.impacts[lo:hi]
+
+    def search(self, query_vec: csr_matrix, top_k: int):
+        """
+        Returns (doc_ids, inner_products) of the top_k documents, best first.
+        Ties are broken by lower doc id, like a stable argsort.
+        """
+        terms = query_vec.indices.astype(np.int64)
+        weights = query_vec.data.astype(np.float64)
+
+        keep = (weights != 0) & (terms < len(self.max_impact))
+        terms, weights = terms[keep], weights[keep]
+        keep = self.indptr[terms + 1] > self.indptr[terms]
+        terms, weights = terms[keep], weights[keep]
+
+        if not self.non_negative or (weights < 0).any():
+            return self._search_exhaustive(terms, weights, top_k)
+
+        ub = weights * self.max_impact[terms]
+
+        order = np.argsort(-ub, kind="stable")
+        terms, weights, ub = terms[order], weights[order], ub[order]
+
+        # remaining[j] = upper bound on what terms j.. can still add
+        remaining = np.concatenate([np.cumsum(ub[::-1])[::-1], [0.0]])
+
+        cand_ids = np.empty(0, dtype=np.int64)
+        cand_scores = np.empty(0, dtype=np.float64)
+        theta = -np.inf
+
+        j = 0
+        # essential terms: any document in their postings may enter the top-k
+        while j < len(terms):
+            if len(cand_ids) >= top_k and theta > remaining[j]:
+                break
+
+            ids, vals = self.postings(terms[j])
+            merged = np.concatenate([cand_ids, ids])
+            cand_ids, inv = np.unique(merged, return_inverse=True)
+            cand_scores = np.bincount(
+                inv,
+                weights=np.concatenate([cand_scores, weights[j] * vals]),
+                minlength=len(cand_ids),
+            )
+            j += 1
+            theta = _kth_largest(cand_scores, top_k)
+
+        # non-essential terms: only finish scoring existing candidates
+        while j < len(terms) and len(cand_ids):
+            alive = cand_scores + remaining[j] >= theta
+            cand_ids, cand_scores = cand_ids[alive], cand_scores[alive]
+
+            ids, vals = self.postings(terms[j])
+            pos = np.searchsorted(ids, cand_ids)
+            pos_clipped = np.minimum(pos, len(ids) - 1)
+            hit = (pos < len(ids)) & (ids[pos_clipped] == cand_ids)
+            cand_scores[hit] += weights[j] * vals[pos_clipped[hit]]
+
+            j += 1
+            theta = _kth_largest(cand_scores, top_k)
+
+        if len(cand_ids) < top_k:
+            # documents sharing no term score 0; pad like the exhaustive path
+            cand_ids, cand_scores = self._pad_zero_scores(cand_ids, cand_scores, top_k)
+
+        return _top_k(cand_ids, cand_scores, top_k)
+
+    def _pad_zero_scores(self, cand_ids, cand_scores, top_k):
+        need = min(top_k, self.n_docs) - len(cand_ids)
+
+        # lowest doc ids that were not scored (cand_ids is sorted)
+        filler = np.arange(need + len(cand_ids))
+        filler = filler[~np.isin(filler, cand_ids, assume_unique=True)][:need]
+        return (
+            np.concatenate([cand_ids, filler]),
+            np.concatenate([cand_scores, np.zeros(len(filler))]),
+        )
+
+    def _search_exhaustive(self, terms, weights, top_k):
+        scores = np.zeros(self.n_docs, dtype=np.float64)
+        for t, w in zip(terms, weights):
+            ids, vals = self.postings(t)
+            scores[ids] += w * vals
+
+        return _top_k(np.arange(self.n_docs), scores, top_k)
+
+
+def _top_k(ids: np.ndarray, scores: np.ndarray, k: int):
+    # best score first, lower doc id first on ties
+    top = np.lexsort((ids, -scores))[:k]
+    return ids[top], scores[top]
+
+
+def _kth_largest(scores: np.ndarray, k: int) -> float:
+    if len(scores) < k:
+        return -np.inf
+    return np.partition(scores, len(scores) - k)[len(scores) - k]
+
+
+def lexical_retrieval_maxscore(
+    df,
+    lexical_index: LexicalIndex,
+    query_sparse_str: str,
+    top_k: int
+) -> pd.DataFrame:
+    """Drop-in replacement for lexical_retrieval_fast."""
+    query_vec = query_to_sparse_vector(query_sparse_str)
+
+    idx, ip = lexical_index.search(query_vec, top_k)
+
+    # pgvector <#> == negative inner product, EXACT SQL match
+    lexical_scores = -ip - 1
+
+    df_out = take_rows(df, idx)
+    df_out["lexical_score"] = lexical_scores
+    df_out["cosine_similarity"] = None
+
+    return df_out[RESULT_COLUMNS]
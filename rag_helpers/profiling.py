@@ -0,0 +1,180 @@
+"""
+Per-stage timing and candidate counts for the retrieval functions.
+
+The retrieval code is instrumented with named stages
+(lexical.parse, lexical.score, lexical.topk, semantic.search,
+materialize, fuse, concat, ...). Profiling is off by default; a stage
+then costs one attribute check and returns a shared no-op context.
+
+    import profiling
+    profiling.configure(sample_rate=0.01)   # profile ~1% of queries
+
+    with profiling.query():                 # one sampling decision per query
+        hybrid_search_fused(...)
+
+    profiling.PROFILER.to_prometheus()      # text exposition format
+    profiling.PROFILER.snapshot()           # JSON-able dict
+
+Stages called outside profiling.query() are sampled individually.
+sample_rate=1.0 records everything (benchmarks, debugging).
+"""
+
+import time
+import random
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+LATENCY_BUCKETS_S = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                     0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (1, 10, 50, 100, 500, 1_000, 5_000, 10_000, 100_000, 1_000_000)
+
+_NOOP = nullcontext()
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last == +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+            "sum": self.sum,
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+        }
+
+
+class _Stage:
+
+    __slots__ = ("profiler", "name", "t0")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.observe_time(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+class Profiler:
+
+    def __init__(self, sample_rate: float = 0.0,
+                 latency_buckets=LATENCY_BUCKETS_S, count_buckets=COUNT_BUCKETS):
+        self.sample_rate = sample_rate
+        self.latency_buckets = latency_buckets
+        self.count_buckets = count_buckets
+        self._timings = {}
+        self._candidates = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _sampled(self) -> bool:
+        if not self.sample_rate:
+            return False
+        sampled = getattr(self._local, "sampled", None)
+        if sampled is None:
+            return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        return sampled
+
+    @contextmanager
+    def query(self):
+        """Sample every stage of one query, or none of them."""
+        previous = getattr(self._local, "sampled", None)
+        self._local.sampled = bool(self.sample_rate) and (
+            self.sample_rate >= 1.0 or random.random() < self.sample_rate)
+        try:
+            if self._local.sampled:
+                with self.stage("query"):
+                    yield
+            else:
+                yield
+        finally:
+            self._local.sampled = previous
+
+    def stage(self, name: str):
+        if not self._sampled():
+            return _NOOP
+        return _Stage(self, name)
+
+    def candidates(self, name: str, n: int) -> None:
+        """Number of candidates produced by a stage."""
+        if self._sampled():
+            self._observe(self._candidates, self.count_buckets, name, n)
+
+    def observe_time(self, name: str, seconds: float) -> None:
+        self._observe(self._timings, self.latency_buckets, name, seconds)
+
+    def _observe(self, table, buckets, name, value) -> None:
+        with self._lock:
+            hist = table.get(name)
+            if hist is None:
+                hist = table[name] = Histogram(buckets)
+            hist.observe(value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._timings.clear()
+            self._candidates.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "sample_rate": self.sample_rate,
+                "stage_seconds": {k: h.snapshot() for k, h in self._timings.items()},
+                "stage_candidates": {k: h.snapshot() for k, h in self._candidates.items()},
+            }
+
+    def to_prometheus(self, prefix: str = "rag") -> str:
+        lines = []
+        with self._lock:
+            for metric, table in ((f"{prefix}_stage_seconds", self._timings),
+                                  (f"{prefix}_stage_candidates", self._candidates)):
+                lines.append(f"# TYPE {metric} histogram")
+                for name in sorted(table):
+                    hist = table[name]
+                    cumulative = 0
+                    for bound, count in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_sum{{stage="{name}"}} {hist.sum}')
+                    lines.append(f'{metric}_count{{stage="{name}"}} {hist.count}')
+        return "\n".join(lines) + "\n"
+
+
+PROFILER = Profiler()
+
+
+def configure(sample_rate: float) -> Profiler:
+    PROFILER.sample_rate = sample_rate
+    return PROFILER
+
+
+def stage(name: str):
+    return PROFILER.stage(name)
+
+
+def candidates(name: str, n: int) -> None:
+    PROFILER.candidates(name, n)
+
+
+def query():
+    return PROFILER.query()
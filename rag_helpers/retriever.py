@@ -0,0 +1,134 @@
+"""
+Lazy, thread-safe entry point for hybrid retrieval.
+
+Importing this module only imports the standard library; numpy, FAISS,
+SciPy and the retrieval modules are imported on first use. Constructing a
+HybridRetriever only records paths. The store, the FAISS index and the
+optional MaxScore lexical index are opened (or built) the first time a
+query needs them, exactly once even under concurrent first calls, and are
+then shared read-only by every thread.
+
+    retriever = HybridRetriever("embedded_store", index_dir="faiss_index")
+    retriever.hybrid(query_sparse_str, query_dense, 50, 50)
+    retriever.warm()      # optional: pay the loading cost up front
+
+Without an index_dir (or when it does not exist yet) the HNSW index is
+built in memory from the store on first semantic query; pass
+build_missing=False to fail instead.
+"""
+
+import os
+import threading
+
+
+class HybridRetriever:
+
+    def __init__(
+        self,
+        store_path: str = "embedded_store",
+        index_dir: str = None,
+        lexical_index_dir: str = None,
+        ef_search=None,
+        build_missing: bool = True,
+    ):
+        self.store_path = store_path
+        self.index_dir = index_dir
+        self.lexical_index_dir = lexical_index_dir
+        self.ef_search = ef_search
+        self.build_missing = build_missing
+
+        self._lock = threading.Lock()
+        self._store = None
+        self._index = None
+        self._manifest = None
+        self._lexical_index = None
+
+    # ---------------- lazy state ----------------
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    from store import EmbeddingStore
+                    self._store = EmbeddingStore.open(self.store_path)
+        return self._store
+
+    @property
+    def index(self):
+        if self._index is None:
+            store = self.store
+            with self._lock:
+                if self._index is None:
+                    self._index, self._manifest = self._open_index(store)
+        return self._index
+
+    @property
+    def manifest(self) -> dict:
+        self.index
+        return self._manifest
+
+    @property
+    def lexical_index(self):
+        """MaxScore index when lexical_index_dir is set, else None (exact CSR scoring)."""
+        if self.lexical_index_dir is None:
+            return None
+        if self._lexical_index is None:
+            with self._lock:
+                if self._lexical_index is None:
+                    from lexical_index import LexicalIndex
+                    self._lexical_index = LexicalIndex.load(self.lexical_index_dir)
+        return self._lexical_index
+
+    def _open_index(self, store):
+        from ann import load_index, load_dense_matrix, build_index
+
+        if self.index_dir is not None and os.path.exists(self.index_dir):
+            return load_index(self.index_dir)
+
+        if not self.build_missing:
+            raise FileNotFoundError(f"No FAISS index at {self.index_dir!r}")
+
+        index = build_index(load_dense_matrix(store))
+        return index, {"index_type": "hnsw_flat", "rerank_factor": 0}
+
+    def _ef_search(self):
+        if self.ef_search is not None:
+            return self.ef_search
+        return self.manifest.get("ef_search_by_top_k")
+
+    def warm(self) -> "HybridRetriever":
+        self.store.sparse
+        self.index
+        self.lexical_index
+        return self
+
+    # ---------------- queries ----------------
+
+    def lexical(self, query_sparse_str: str, top_k: int):
+        if self.lexical_index is not None:
+            from lexical_index import lexical_retrieval_maxscore
+            return lexical_retrieval_maxscore(self.store, self.lexical_index, query_sparse_str, top_k)
+
+        from runner import lexical_retrieval_fast
+        return lexical_retrieval_fast(self.store, self.store.sparse, query_sparse_str, top_k)
+
+    def semantic(self, query_dense, top_k: int):
+        from ann import semantic_retrieval_faiss
+
+        return semantic_retrieval_faiss(
+            self.store, self.index, query_dense, top_k,
+            rerank_factor=self.manifest.get("rerank_factor", 0),
+            ef_search=self._ef_search(),
+        )
+
+    def hybrid(self, query_sparse_str: str, query_dense, top_k_lexical: int,
+               top_k_semantic: int, union_all: bool = False):
+        from hybrid import hybrid_search_fused
+
+        return hybrid_search_fused(
+            self.store, self.store.sparse, query_sparse_str, query_dense,
+            top_k_lexical, top_k_semantic, index=self.index, union_all=union_all,
+            rerank_factor=self.manifest.get("rerank_factor", 0),
+            ef_search=self._ef_search(),
+        )
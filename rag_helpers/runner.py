@@ -1,9 +1,22 @@
-import pickle
 import numpy as np
 import pandas as pd
 from typing import List, Dict
 from scipy.sparse import csr_matrix
 
+from store import EmbeddingStore, take_rows, dense_matrix
+from profiling import stage, candidates
+
+STORE_PATH = "embedded_store"
+
+RESULT_COLUMNS = [
+    "embedding_id",
+    "article_id",
+    "document",
+    "lexical_score",
+    "cosine_similarity",
+    "metadata",
+]
+
 
 def sparse_dict_to_vector(sparse_dict: Dict[int, float], dim: int) -> np.ndarray:
     vec = np.zeros(dim, dtype=np.float32)
@@ -61,6 +74,124 @@ def build_sparse_matrix(sparse_strings: pd.Series):
     mat = csr_matrix((data, (rows, cols)), shape=(len(sparse_strings), dim))
     return mat
 
+
+def _sparse_block_counts(sparse_strings):
+    """nnz per row and declared dim per row, without parsing values."""
+    s = pd.Series(sparse_strings, dtype=object)
+    parts = s.str.rpartition("/")
+
+    dims = parts[2].astype(np.int64).to_numpy()
+    counts = parts[0].str.count(":").to_numpy(dtype=np.int64)
+    return counts, dims
+
+
+def _parse_sparse_block(sparse_strings, dtype=np.float64):
+    """
+    Tokenize a block of '{k:v,k:v}/dim' strings in one pass.
+    Returns the concatenated (indices, data) for the block, in row order.
+    """
+    s = pd.Series(sparse_strings, dtype=object)
+    bodies = s.str.rpartition("/")[0].str.strip().str.strip("{}")
+    bodies = bodies[bodies.str.strip() != ""]
+
+    # '1:0.5,7:0.25' → '1,0.5,7,0.25' → [1, 0.5, 7, 0.25]
+    text = ",".join(bodies).replace(":", ",")
+    flat = np.fromstring(text, dtype=np.float64, sep=",") if text else np.empty(0)
+
+    if flat.size % 2:
+        raise ValueError("Malformed sparse string")
+
+    return flat[0::2].astype(np.int32), flat[1::2].astype(dtype)
+
+
+def _parse_sparse_range(args):
+    sparse_strings, dtype = args
+    return _parse_sparse_block(sparse_strings, dtype)
+
+
+def build_sparse_matrix_bulk(
+    sparse_strings: pd.Series,
+    n_jobs: int = 1,
+    block_size: int = 100_000,
+    dtype=np.float64,
+) -> csr_matrix:
+    """
+    Same result as build_sparse_matrix, without per-term Python work.
+
+    Pass 1 counts terms per row to size the CSR buffers exactly.
+    Pass 2 parses row ranges (optionally in n_jobs processes) and writes
+    each range straight into its slice of the preallocated buffers.
+    """
+    sparse_strings = np.asarray(sparse_strings, dtype=object)
+    n = len(sparse_strings)
+
+    counts, dims = _sparse_block_counts(sparse_strings)
+    if n and (dims != dims[0]).any():
+        raise ValueError("Sparse dimension mismatch")
+    dim = int(dims[0]) if n else 0
+
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    data = np.empty(indptr[-1], dtype=dtype)
+
+    ranges = [(a, min(a + block_size, n)) for a in range(0, n, block_size)]
+    jobs = ((sparse_strings[a:b], dtype) for a, b in ranges)
+
+    if n_jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parsed = pool.map(_parse_sparse_range, jobs)
+            for (a, b), (idx, val) in zip(ranges, parsed):
+                _fill_csr_range(indices, data, indptr, a, b, idx, val)
+    else:
+        for (a, b), job in zip(ranges, jobs):
+            idx, val = _parse_sparse_range(job)
+            _fill_csr_range(indices, data, indptr, a, b, idx, val)
+
+    mat = csr_matrix((data, indices, indptr), shape=(n, dim), copy=False)
+    mat.sort_indices()
+    return mat
+
+
+def _fill_csr_range(indices, data, indptr, a, b, idx, val):
+    lo, hi = indptr[a], indptr[b]
+    if hi - lo != len(idx):
+        raise ValueError(f"Malformed sparse string in rows {a}..{b}")
+    indices[lo:hi] = idx
+    data[lo:hi] = val
+
+
+def benchmark_sparse_parsers(sparse_strings: pd.Series, n_jobs: int = 1) -> dict:
+    """Time build_sparse_matrix vs build_sparse_matrix_bulk and check they agree."""
+    import time
+
+    t0 = time.perf_counter()
+    ref = build_sparse_matrix(sparse_strings)
+    t_ref = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    bulk = build_sparse_matrix_bulk(sparse_strings, n_jobs=n_jobs)
+    t_bulk = time.perf_counter() - t0
+
+    diff = abs(ref - bulk)
+    result = {
+        "rows": len(sparse_strings),
+        "nnz": int(ref.nnz),
+        "reference_s": t_ref,
+        "bulk_s": t_bulk,
+        "speedup": t_ref / t_bulk if t_bulk else float("inf"),
+        "identical": ref.shape == bulk.shape and diff.nnz == 0,
+    }
+    print(result)
+    return result
+
+def format_sparse_string(indices, values, dim: int) -> str:
+    """Inverse of parse_sparse_string_fast: '{k:v,k:v}/dim'."""
+    return "{" + ",".join(f"{k}:{v}" for k, v in zip(indices, values)) + f"}}/{dim}"
+
+
 def query_to_sparse_vector(query_sparse_str: str):
     d, dim = parse_sparse_string_fast(query_sparse_str)
 
@@ -69,48 +200,178 @@ def query_to_sparse_vector(query_sparse_str: str):
 
     return csr_matrix((data, ([0] * len(cols), cols)), shape=(1, dim))
 
-def lexical_retrieval_fast(
-    df: pd.DataFrame,
+def lexical_candidates(
     doc_sparse_matrix: csr_matrix,
     query_sparse_str: str,
     top_k: int
-) -> pd.DataFrame:
-
-    query_vec = query_to_sparse_vector(query_sparse_str)
+):
+    """(row idx, lexical_score) of the top_k rows, best first; no row data."""
+    with stage("lexical.parse"):
+        query_vec = query_to_sparse_vector(query_sparse_str)
 
     # pgvector <#> == negative inner product
     # result shape: (N, 1)
-    scores = -(doc_sparse_matrix @ query_vec.T).toarray().ravel()
+    with stage("lexical.score"):
+        scores = -(doc_sparse_matrix @ query_vec.T).toarray().ravel()
 
     lexical_scores = scores - 1  # EXACT SQL match
 
-    idx = np.argsort(lexical_scores)[:top_k]
+    with stage("lexical.topk"):
+        idx = np.argsort(lexical_scores)[:top_k]
+    candidates("lexical.topk", len(idx))
+
+    return idx, lexical_scores[idx]
+
+
+def lexical_candidates_batch(
+    doc_sparse_matrix: csr_matrix,
+    query_sparse_strs,
+    top_k: int,
+    block_size: int = 1024,
+    n_jobs: int = 1,
+):
+    """
+    Many queries with sparse x sparse products instead of one mat-vec each.
+    Queries are parsed into one CSR, then scored block_size queries at a
+    time (bounds the (N, block) product), blocks spread over n_jobs threads.
+    Returns (idx, lexical_scores), both (n_queries, top_k), best first;
+    padded with -1 / inf when the corpus has fewer than top_k rows.
+    """
+    queries = build_sparse_matrix_bulk(query_sparse_strs)
+    n_queries = queries.shape[0]
+
+    idx = np.full((n_queries, top_k), -1, dtype=np.int64)
+    lexical_scores = np.full((n_queries, top_k), np.inf)
+
+    def run_block(a):
+        b = min(a + block_size, n_queries)
+        # (N, b - a): only documents sharing a term with a query are stored
+        ip = (doc_sparse_matrix @ queries[a:b].T).tocsc()
+        idx[a:b], lexical_scores[a:b] = _top_k_columns(ip, top_k)
+
+    starts = range(0, n_queries, block_size)
+    if n_jobs > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            list(pool.map(run_block, starts))
+    else:
+        for a in starts:
+            run_block(a)
+
+    return idx, lexical_scores
+
+
+def _top_k_columns(ip, top_k: int):
+    """
+    Per-column top-k of a (N, Q) CSC inner-product matrix, all columns at
+    once: one lexsort of the positive entries by (column, -score, row).
+    Columns with fewer than top_k positive scores go through
+    _top_k_inner_products for the zero / negative fill.
+    """
+    n_docs, n_queries = ip.shape
+    cols = np.repeat(np.arange(n_queries), np.diff(ip.indptr))
+
+    positive = ip.data > 0
+    c, r, v = cols[positive], ip.indices[positive], ip.data[positive]
+    order = np.lexsort((r, -v, c))
+    c, r, v = c[order], r[order], v[order]
+
+    counts = np.bincount(c, minlength=n_queries)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(len(c)) - starts[c]
+    keep = rank < top_k
+
+    idx = np.full((n_queries, top_k), -1, dtype=np.int64)
+    lexical_scores = np.full((n_queries, top_k), np.inf)
+    idx[c[keep], rank[keep]] = r[keep]
+    # pgvector <#> == negative inner product, EXACT SQL match
+    lexical_scores[c[keep], rank[keep]] = -v[keep] - 1
+
+    for q in np.flatnonzero(counts < min(top_k, n_docs)):
+        lo, hi = ip.indptr[q], ip.indptr[q + 1]
+        rows, scores = _top_k_inner_products(ip.indices[lo:hi], ip.data[lo:hi], n_docs, top_k)
+        idx[q, :len(rows)] = rows
+        lexical_scores[q, :len(rows)] = -scores - 1
+
+    return idx, lexical_scores
+
+
+def _top_k_inner_products(rows, ip, n_docs: int, top_k: int):
+    """
+    Top-k of one query column where unlisted documents score 0:
+    positive scores, then zero scores by row id, then negative scores.
+    """
+    positive = ip > 0
+    order = np.lexsort((rows[positive], -ip[positive]))[:top_k]
+    out_rows, out_ip = [rows[positive][order]], [ip[positive][order]]
+
+    need = min(top_k, n_docs) - len(order)
+    if need > 0:
+        nonzero_rows = rows[ip != 0]
+        filler = np.arange(min(need + len(nonzero_rows), n_docs))
+        filler = filler[~np.isin(filler, nonzero_rows)][:need]
+        out_rows.append(filler)
+        out_ip.append(np.zeros(len(filler)))
+        need -= len(filler)
+
+    if need > 0:
+        negative = ip < 0
+        order = np.lexsort((rows[negative], -ip[negative]))[:need]
+        out_rows.append(rows[negative][order])
+        out_ip.append(ip[negative][order])
+
+    return np.concatenate(out_rows), np.concatenate(out_ip)
+
+
+def lexical_retrieval_fast(
+    df,
+    doc_sparse_matrix: csr_matrix,
+    query_sparse_str: str,
+    top_k: int
+) -> pd.DataFrame:
+
+    idx, lexical_scores = lexical_candidates(doc_sparse_matrix, query_sparse_str, top_k)
 
-    df_out = df.iloc[idx].copy()
-    df_out["lexical_score"] = lexical_scores[idx]
+    # only the top_k rows are materialized (works on a DataFrame or a store)
+    with stage("materialize"):
+        df_out = take_rows(df, idx)
+    df_out["lexical_score"] = lexical_scores
     df_out["cosine_similarity"] = None
 
-    return df_out[
-        [
-            "embedding_id",
-            "article_id",
-            "document",
-            "lexical_score",
-            "cosine_similarity",
-            "metadata",
-        ]
-    ]
-
-# one-time cost
-doc_sparse_matrix = build_sparse_matrix(df["sparse_embedding"])
-
-# per query
-results = lexical_retrieval_fast(
+    return df_out[RESULT_COLUMNS]
+
+def lexical_retrieval_batch(
     df,
-    doc_sparse_matrix,
-    query_sparse_str,
-    top_k=20
-)
+    doc_sparse_matrix: csr_matrix,
+    query_sparse_strs,
+    top_k: int,
+    block_size: int = 1024,
+    n_jobs: int = 1,
+) -> pd.DataFrame:
+    """
+    Multi-query lexical_retrieval_fast; long-form frame keyed by
+    query_id / rank, same layout as semantic_retrieval_batch.
+    """
+    idx, lexical_scores = lexical_candidates_batch(
+        doc_sparse_matrix, query_sparse_strs, top_k, block_size=block_size, n_jobs=n_jobs)
+
+    valid = idx >= 0
+    query_ids, ranks = np.nonzero(valid)
+
+    rows = take_rows(df, idx[valid])
+
+    out = pd.DataFrame({
+        "query_id": query_ids,
+        "rank": ranks,
+        "embedding_id": rows["embedding_id"].to_numpy(),
+        "article_id": rows["article_id"].to_numpy(),
+        "document": rows["document"].to_numpy(),
+        "lexical_score": lexical_scores[valid],
+        "cosine_similarity": None,
+        "metadata": rows["metadata"].to_numpy(),
+    })
+
+    return out
 
 # import ast
 
@@ -217,63 +478,155 @@ results = lexical_retrieval_fast(
 #     ]
 
 
-def semantic_retrieval(
-    df: pd.DataFrame,
+def normalize_rows(x: np.ndarray) -> np.ndarray:
+    """
+    float32 copy with unit-length rows.
+    Zero rows stay zero, so their distance is 1.0 like cosine_distance.
+    """
+    x = np.array(x, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    np.divide(x, norms, out=x, where=norms > 0)
+    return x
+
+
+def exact_dense_search(
+    doc_normalized: np.ndarray,
     query_dense: np.ndarray,
-    top_k: int
-) -> pd.DataFrame:
-    distances = []
+    top_k: int,
+    block_size: int = 65536,
+):
+    """
+    Brute-force cosine top-k over pre-normalized document vectors.
+
+    Scores one corpus block per matrix multiply and keeps a running
+    (n_queries, top_k) best list, merged with argpartition after each block.
+    Returns (idx, distances), both (n_queries, top_k), closest first.
+    """
+    q = normalize_rows(query_dense)
+    n_docs = doc_normalized.shape[0]
+    top_k = min(top_k, n_docs)
 
-    for _, row in df.iterrows():
-        doc_dense = np.asarray(row["dense_embedding"])
-        dist = cosine_distance(doc_dense, query_dense)
-        distances.append(dist)
+    best_idx = np.empty((len(q), 0), dtype=np.int64)
+    best_sim = np.empty((len(q), 0), dtype=np.float32)
 
-    df_out = df.copy()
-    df_out["cosine_similarity"] = distances
+    for start in range(0, n_docs, block_size):
+        block = np.asarray(doc_normalized[start:start + block_size], dtype=np.float32)
+        sims = q @ block.T
+
+        k = min(top_k, block.shape[0])
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+
+        cand_idx = np.concatenate([best_idx, part + start], axis=1)
+        cand_sim = np.concatenate(
+            [best_sim, np.take_along_axis(sims, part, axis=1)], axis=1
+        )
+
+        if cand_idx.shape[1] > top_k:
+            keep = np.argpartition(-cand_sim, top_k - 1, axis=1)[:, :top_k]
+            cand_idx = np.take_along_axis(cand_idx, keep, axis=1)
+            cand_sim = np.take_along_axis(cand_sim, keep, axis=1)
+
+        best_idx, best_sim = cand_idx, cand_sim
+
+    # closest first, lower row first on ties
+    order = np.lexsort((best_idx, -best_sim), axis=-1)
+    best_idx = np.take_along_axis(best_idx, order, axis=1)
+    best_sim = np.take_along_axis(best_sim, order, axis=1)
+
+    return best_idx, 1.0 - best_sim.astype(np.float64)
+
+
+def semantic_retrieval(
+    df,
+    query_dense: np.ndarray,
+    top_k: int,
+    doc_normalized: np.ndarray = None,
+) -> pd.DataFrame:
+    """
+    Exact cosine ground truth. Pass doc_normalized = normalize_rows(dense_matrix(df))
+    to normalize the corpus once instead of on every call.
+    """
+    if doc_normalized is None:
+        doc_normalized = normalize_rows(dense_matrix(df))
+
+    with stage("semantic.exact"):
+        idx, distances = exact_dense_search(doc_normalized, query_dense, top_k)
+    candidates("semantic.exact", idx.shape[1])
+
+    with stage("materialize"):
+        df_out = take_rows(df, idx[0])
+    df_out["cosine_similarity"] = distances[0]
     df_out["lexical_score"] = None
 
-    df_out = df_out.sort_values("cosine_similarity").head(top_k)
+    return df_out[RESULT_COLUMNS]
 
-    return df_out[
-        [
-            "embedding_id",
-            "article_id",
-            "document",
-            "lexical_score",
-            "cosine_similarity",
-            "metadata",
-        ]
-    ]
+
+def semantic_retrieval_batch(
+    df,
+    query_dense: np.ndarray,
+    top_k: int,
+    doc_normalized: np.ndarray = None,
+) -> pd.DataFrame:
+    """
+    Multi-query exact search; long-form frame keyed by query_id / rank,
+    same layout as ann.semantic_retrieval_faiss_batch.
+    """
+    if doc_normalized is None:
+        doc_normalized = normalize_rows(dense_matrix(df))
+
+    idx, distances = exact_dense_search(doc_normalized, query_dense, top_k)
+    query_ids, ranks = np.indices(idx.shape)
+
+    rows = take_rows(df, idx.ravel())
+
+    out = pd.DataFrame({
+        "query_id": query_ids.ravel(),
+        "rank": ranks.ravel(),
+        "embedding_id": rows["embedding_id"].to_numpy(),
+        "article_id": rows["article_id"].to_numpy(),
+        "document": rows["document"].to_numpy(),
+        "lexical_score": None,
+        "cosine_similarity": distances.ravel(),
+        "metadata": rows["metadata"].to_numpy(),
+    })
+
+    return out
 
 def hybrid_search(
     df: pd.DataFrame,
-    query_sparse: np.ndarray,
+    doc_sparse_matrix: csr_matrix,
+    query_sparse_str: str,
     query_dense: np.ndarray,
     top_k_lexical: int,
     top_k_semantic: int,
 ) -> pd.DataFrame:
-    lexical_df = lexical_retrieval(df, query_sparse, top_k_lexical)
-    semantic_df = semantic_retrieval(df, query_dense, top_k_semantic)
+    # hybrid imports this module
+    from hybrid import hybrid_search_fused
+
+    # UNION ALL (no dedup, no re-rank), exact on both legs
+    return hybrid_search_fused(
+        df, doc_sparse_matrix, query_sparse_str, query_dense,
+        top_k_lexical, top_k_semantic, union_all=True,
+    )
 
-    # UNION ALL (no dedup, no re-rank)
-    return pd.concat([lexical_df, semantic_df], ignore_index=True)
 
+if __name__ == "__main__":
+    # Open the columnar store (python store.py convert ...); only the
+    # manifest is read here, vectors and text are memory-mapped on use
+    store = EmbeddingStore.open(STORE_PATH)
 
-# Load data
-with open("embedded_data.pickle", "rb") as f:
-    embedded_df = pickle.load(f)
+    # one-time cost: none, the CSR buffers are already on disk
+    doc_sparse_matrix = store.sparse
 
-# Example query vectors
-query_sparse = np.random.rand(50000).astype(np.float32)  # match sparse dim
-query_dense = np.random.rand(768).astype(np.float32)
+    # Example query: reuse the first document's vectors
+    row = doc_sparse_matrix[0]
+    query_sparse_str = format_sparse_string(row.indices, row.data, doc_sparse_matrix.shape[1])
+    query_dense = np.asarray(store.dense[0], dtype=np.float32)
 
-results = hybrid_search(
-    embedded_df,
-    query_sparse=query_sparse,
-    query_dense=query_dense,
-    top_k_lexical=50,
-    top_k_semantic=50,
-)
+    # per query
+    results = pd.concat([
+        lexical_retrieval_fast(store, doc_sparse_matrix, query_sparse_str, top_k=20),
+        semantic_retrieval(store, query_dense, top_k=20),
+    ], ignore_index=True)
 
-print(results.head())
+    print(results.head())
@@ -0,0 +1,344 @@
+"""
+Async HTTP/JSON hybrid search service with request micro-batching.
+
+The store, FAISS index and sparse matrix are opened once and stay
+resident. Concurrent requests are collected for up to --window-ms (or
+--max-batch requests) and answered together with one index.search for
+the dense leg and one sparse-matrix x sparse-matrix product for the
+lexical leg; rows for the whole batch are gathered from the store once.
+
+Backpressure: the pending queue is bounded (--max-queue); when it is full
+new requests get 503 immediately. Every request carries a deadline
+(deadline_ms, default --deadline-ms); requests that expire while queued
+are dropped before search and answered with 504.
+
+    python service.py --store embedded_store --index faiss_index --port 8080
+
+    POST /search
+    {"query_sparse": "{12:0.4,907:1.2}/995300", "query_dense": [...768 floats],
+     "top_k_lexical": 50, "top_k_semantic": 50, "deadline_ms": 200,
+     "union_all": false}
+
+    GET /health   queue depth and counters
+    GET /metrics  per-stage timing histograms (JSON, see profiling.py;
+                  enable with --profile-sample-rate)
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from store import EmbeddingStore, take_rows
+from runner import RESULT_COLUMNS, lexical_candidates_batch, query_to_sparse_vector
+from ann import load_index, semantic_candidates_faiss
+from hybrid import fuse_candidates, none_if_nan
+import profiling
+
+
+WINDOW_MS = 3.0
+MAX_BATCH = 64
+MAX_QUEUE = 1024
+DEADLINE_MS = 1000.0
+
+
+class Overloaded(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+@dataclass
+class SearchRequest:
+    query_sparse: str
+    query_dense: np.ndarray
+    top_k_lexical: int
+    top_k_semantic: int
+    deadline: float  # loop.time() seconds
+    union_all: bool = False
+    future: asyncio.Future = field(default=None, repr=False)
+
+
+class BatchSearchEngine:
+    """Resident index state; answers a list of requests in one pass."""
+
+    def __init__(self, store: EmbeddingStore, index, ef_search=None, rerank_factor: int = 0):
+        self.store = store
+        self.index = index
+        self.doc_sparse = store.sparse
+        self.ef_search = ef_search
+        # compressed indexes re-rank against the full-precision store vectors
+        self.rerank_factor = rerank_factor
+        self.dense_dim = index.d
+        self.sparse_dim = self.doc_sparse.shape[1]
+
+    def search_batch(self, requests) -> list:
+        k_lex = max(r.top_k_lexical for r in requests)
+        k_sem = max(r.top_k_semantic for r in requests)
+
+        if k_lex:
+            with profiling.stage("lexical.batch"):
+                lex_idx, lex_scores = lexical_candidates_batch(
+                    self.doc_sparse, [r.query_sparse for r in requests], k_lex)
+        if k_sem:
+            sem_idx, sem_dists = semantic_candidates_faiss(
+                self.index, np.stack([r.query_dense for r in requests]), k_sem,
+                rerank_vectors=self.store.dense if self.rerank_factor else None,
+                rerank_factor=self.rerank_factor, ef_search=self.ef_search)
+
+        fused = []
+        for i, r in enumerate(requests):
+            li = lex_idx[i, :r.top_k_lexical] if k_lex else np.empty(0, dtype=np.int64)
+            ls = lex_scores[i, :r.top_k_lexical] if k_lex else np.empty(0)
+            si = sem_idx[i, :r.top_k_semantic] if k_sem else np.empty(0, dtype=np.int64)
+            sd = sem_dists[i, :r.top_k_semantic] if k_sem else np.empty(0)
+            fused.append(fuse_candidates(li[li >= 0], ls[li >= 0], si[si >= 0], sd[si >= 0],
+                                         union_all=r.union_all))
+
+        # one gather for every row of the batch
+        all_idx = np.concatenate([f[0] for f in fused]) if fused else np.empty(0, dtype=np.int64)
+        uniq, inv = np.unique(all_idx, return_inverse=True)
+        with profiling.stage("materialize"):
+            rows = take_rows(self.store, uniq)
+        profiling.candidates("materialize", len(uniq))
+
+        results, offset = [], 0
+        for idx, lexical, cosine in fused:
+            out = rows.iloc[inv[offset:offset + len(idx)]].reset_index(drop=True)
+            offset += len(idx)
+            out["lexical_score"] = none_if_nan(lexical)
+            out["cosine_similarity"] = none_if_nan(cosine)
+            results.append(out[RESULT_COLUMNS].to_dict("records"))
+
+        return results
+
+
+class MicroBatcher:
+
+    def __init__(self, engine: BatchSearchEngine, window_ms: float = WINDOW_MS,
+                 max_batch: int = MAX_BATCH, max_queue: int = MAX_QUEUE):
+        self.engine = engine
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        # searches run off the event loop; FAISS/SciPy release the GIL
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.stats = {"served": 0, "rejected": 0, "expired": 0, "batches": 0, "batched_requests": 0}
+
+    async def submit(self, request: SearchRequest) -> list:
+        loop = asyncio.get_running_loop()
+        request.future = loop.create_future()
+
+        try:
+            self.queue.put_nowait(request)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise Overloaded()
+
+        timeout = request.deadline - loop.time()
+        try:
+            return await asyncio.wait_for(asyncio.shield(request.future), max(timeout, 0))
+        except asyncio.TimeoutError:
+            self.stats["expired"] += 1
+            raise DeadlineExceeded()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            flush_at = loop.time() + self.window
+
+            while len(batch) < self.max_batch:
+                remaining = flush_at - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # drop requests whose caller already gave up
+            now = loop.time()
+            batch = [r for r in batch if r.deadline > now and not r.future.done()]
+            if not batch:
+                continue
+
+            self.stats["batches"] += 1
+            self.stats["batched_requests"] += len(batch)
+            try:
+                results = await loop.run_in_executor(self.executor, self.engine.search_batch, batch)
+            except Exception as e:
+                for r in batch:
+                    if not r.future.done():
+                        r.future.set_exception(e)
+                continue
+
+            for r, res in zip(batch, results):
+                if not r.future.done():
+                    r.future.set_result(res)
+                    self.stats["served"] += 1
+
+
+def _json_default(o):
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    return str(o)
+
+
+async def _send(writer, status: int, payload, keep_alive: bool):
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 503: "Service Unavailable",
+              504: "Gateway Timeout", 500: "Internal Server Error"}[status]
+    body = json.dumps(payload, default=_json_default).encode()
+    writer.write(
+        f"HTTP/1.1 {status} {reason}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+
+
+def _parse_search(body: bytes, default_deadline_ms: float, dense_dim: int, sparse_dim: int) -> SearchRequest:
+    """Request from a /search body; ValueError / KeyError / TypeError / OverflowError -> 400."""
+    req = json.loads(body)
+    if not isinstance(req, dict):
+        raise TypeError("body must be a JSON object")
+
+    # parse now so a malformed query fails this request, not its whole batch
+    query_sparse = req["query_sparse"]
+    if not isinstance(query_sparse, str):
+        raise TypeError("query_sparse must be a '{k:v,...}/dim' string")
+    dim = query_to_sparse_vector(query_sparse).shape[1]
+    if dim != sparse_dim:
+        raise ValueError(f"query_sparse has dimension {dim}, expected {sparse_dim}")
+
+    query_dense = np.asarray(req["query_dense"], dtype=np.float32)
+    if query_dense.shape != (dense_dim,):
+        raise ValueError(f"query_dense has shape {query_dense.shape}, expected ({dense_dim},)")
+
+    top_k_lexical = int(req.get("top_k_lexical", 50))
+    top_k_semantic = int(req.get("top_k_semantic", 50))
+    if top_k_lexical <= 0 or top_k_semantic <= 0:
+        raise ValueError("top_k_lexical and top_k_semantic must be positive")
+
+    loop = asyncio.get_running_loop()
+    return SearchRequest(
+        query_sparse=query_sparse,
+        query_dense=query_dense,
+        top_k_lexical=top_k_lexical,
+        top_k_semantic=top_k_semantic,
+        deadline=loop.time() + float(req.get("deadline_ms", default_deadline_ms)) / 1000,
+        union_all=bool(req.get("union_all", False)),
+    )
+
+
+def make_handler(batcher: MicroBatcher, default_deadline_ms: float = DEADLINE_MS):
+    dense_dim, sparse_dim = batcher.engine.dense_dim, batcher.engine.sparse_dim
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+
+                lines = head.decode("latin-1").split("\r\n")
+                headers = {k.strip().lower(): v.strip()
+                           for k, v in (l.split(":", 1) for l in lines[1:] if ":" in l)}
+                try:
+                    method, path, _ = lines[0].split(" ", 2)
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    # framing is unknown, so the connection cannot be reused
+                    await _send(writer, 400, {"error": "malformed request"}, False)
+                    return
+                body = await reader.readexactly(length)
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+
+                if method == "GET" and path == "/health":
+                    await _send(writer, 200, {"queue": batcher.queue.qsize(), **batcher.stats}, keep_alive)
+                elif method == "GET" and path == "/metrics":
+                    await _send(writer, 200, profiling.PROFILER.snapshot(), keep_alive)
+                elif method == "POST" and path == "/search":
+                    t0 = time.perf_counter()
+                    try:
+                        request = _parse_search(body, default_deadline_ms, dense_dim, sparse_dim)
+                    except (ValueError, KeyError, TypeError, OverflowError) as e:
+                        await _send(writer, 400, {"error": f"bad request: {e}"}, keep_alive)
+                        continue
+                    try:
+                        results = await batcher.submit(request)
+                    except Overloaded:
+                        await _send(writer, 503, {"error": "overloaded"}, keep_alive)
+                    except DeadlineExceeded:
+                        await _send(writer, 504, {"error": "deadline exceeded"}, keep_alive)
+                    except Exception as e:
+                        await _send(writer, 500, {"error": repr(e)}, keep_alive)
+                    else:
+                        await _send(writer, 200, {
+                            "results": results,
+                            "took_ms": (time.perf_counter() - t0) * 1000,
+                        }, keep_alive)
+                else:
+                    await _send(writer, 404, {"error": "not found"}, keep_alive)
+
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(store_path, index_dir, host, port, window_ms, max_batch, max_queue, deadline_ms):
+    store = EmbeddingStore.open(store_path)
+    index, manifest = load_index(index_dir)
+    engine = BatchSearchEngine(store, index, ef_search=manifest.get("ef_search_by_top_k"),
+                               rerank_factor=manifest.get("rerank_factor", 0))
+
+    batcher = MicroBatcher(engine, window_ms, max_batch, max_queue)
+    batch_task = asyncio.create_task(batcher.run())
+
+    server = await asyncio.start_server(make_handler(batcher, deadline_ms), host, port)
+    print(f"✓ Serving {len(store)} rows on http://{host}:{port}")
+
+    async with server:
+        try:
+            await server.serve_forever()
+        finally:
+            batch_task.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-batching hybrid search service")
+    parser.add_argument("--store", default="embedded_store")
+    parser.add_argument("--index", default="faiss_index")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--window-ms", type=float, default=WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    parser.add_argument("--deadline-ms", type=float, default=DEADLINE_MS)
+    parser.add_argument("--profile-sample-rate", type=float, default=0.0,
+                        help="share of searches recorded in the /metrics histograms")
+    args = parser.parse_args(argv)
+
+    profiling.configure(args.profile_sample_rate)
+
+    asyncio.run(serve(args.store, args.index, args.host, args.port, args.window_ms,
+                      args.max_batch, args.max_queue, args.deadline_ms))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
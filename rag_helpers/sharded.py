@@ -0,0 +1,370 @@
+"""
+Sharded, multi-core retrieval with exact top-k merge.
+
+The corpus is partitioned into N shards by row range or by article_id
+(all chunks of an article land in the same shard). Each shard directory
+holds:
+
+    rows.npy                 global store row of every shard row
+    sparse_*.npy             the shard's CSR slice
+    faiss/index.faiss        the shard's own HNSW index (+ manifest.json)
+
+Every shard returns its own top-k per leg as (global row, score); the
+per-shard lists are merged exactly (lower score is better in both legs,
+ties by lower row), so lexical results are identical to the unsharded
+path and dense results only differ by HNSW's own approximation.
+
+Shards can be queried with a thread pool (FAISS search and SciPy's
+sparse products release the GIL), a process pool, or as separate worker
+processes reached over multiprocessing.connection (`serve`), which is the
+same protocol a remote node would speak.
+
+    python sharded.py build --store embedded_store --shards 8 --by article_id --out shards
+    RAG_SHARD_AUTHKEY=... python sharded.py serve shards/shard_003 --port 6003
+
+multiprocessing.connection unpickles every message, so shard connections
+are always authenticated. The key comes from RAG_SHARD_AUTHKEY (or
+--authkey-file); there is no default. Without a key, serve only binds to
+a loopback address and prints a one-off key for its clients.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import secrets
+import ipaddress
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing.connection import Listener, Client
+from scipy.sparse import csr_matrix
+
+from store import EmbeddingStore, take_rows
+from runner import RESULT_COLUMNS, lexical_candidates, normalize_rows
+from ann import (
+    M,
+    EF_CONSTRUCTION,
+    EF_SEARCH,
+    build_index,
+    save_index,
+    load_index,
+    corpus_hash,
+    semantic_candidates_faiss,
+)
+from hybrid import fuse_candidates, none_if_nan
+
+
+ROWS_FILE = "rows.npy"
+INDPTR_FILE = "sparse_indptr.npy"
+INDICES_FILE = "sparse_indices.npy"
+DATA_FILE = "sparse_data.npy"
+FAISS_DIR = "faiss"
+SHARDS_MANIFEST = "shards.json"
+
+AUTHKEY_ENV = "RAG_SHARD_AUTHKEY"
+
+
+def shard_authkey(authkey=None):
+    """authkey as bytes: the explicit value, else $RAG_SHARD_AUTHKEY, else None."""
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV) or None
+    if isinstance(authkey, str):
+        authkey = authkey.encode()
+    return authkey
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def partition_rows(store: EmbeddingStore, n_shards: int, by: str = "row") -> list:
+    """Global row ids of each shard."""
+    n = len(store)
+    if by == "row":
+        bounds = np.linspace(0, n, n_shards + 1).astype(np.int64)
+        return [np.arange(bounds[s], bounds[s + 1]) for s in range(n_shards)]
+    if by == "article_id":
+        article = pd.util.hash_array(np.asarray(store["article_id"]).astype(str))
+        shard_of = article % np.uint64(n_shards)
+        return [np.flatnonzero(shard_of == s) for s in range(n_shards)]
+    raise ValueError(f"Unknown partitioning {by!r}, expected 'row' or 'article_id'")
+
+
+def build_shards(
+    store_path: str,
+    out_dir: str,
+    n_shards: int,
+    by: str = "row",
+    m: int = M,
+    ef_construction: int = EF_CONSTRUCTION,
+    ef_search: int = EF_SEARCH,
+) -> dict:
+    store = EmbeddingStore.open(store_path)
+    parts = partition_rows(store, n_shards, by)
+
+    shard_dirs = []
+    for s, rows in enumerate(parts):
+        shard_dir = os.path.join(out_dir, f"shard_{s:03d}")
+        os.makedirs(shard_dir, exist_ok=True)
+        t0 = time.time()
+
+        np.save(os.path.join(shard_dir, ROWS_FILE), rows)
+
+        sparse = store.sparse[rows]
+        np.save(os.path.join(shard_dir, INDPTR_FILE), sparse.indptr.astype(np.int64))
+        np.save(os.path.join(shard_dir, INDICES_FILE), sparse.indices.astype(np.int32))
+        np.save(os.path.join(shard_dir, DATA_FILE), sparse.data.astype(np.float32))
+
+        dense = normalize_rows(store.dense[rows])
+        index = build_index(dense, m, ef_construction, ef_search)
+        save_index(index, os.path.join(shard_dir, FAISS_DIR), {
+            "index_type": "hnsw_flat",
+            "dim": int(dense.shape[1]),
+            "n_vectors": int(len(rows)),
+            "m": m,
+            "ef_construction": ef_construction,
+            "ef_search": ef_search,
+            "metric": "inner_product",
+            "corpus_hash": corpus_hash(dense),
+            "source": os.path.abspath(store_path),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+
+        shard_dirs.append(os.path.basename(shard_dir))
+        print(f"✓ Shard {s}: {len(rows)} rows in {time.time() - t0:.1f}s")
+
+    manifest = {"store": os.path.abspath(store_path), "n_shards": n_shards,
+                "partition": by, "shards": shard_dirs, "sparse_dim": store.sparse.shape[1]}
+    with open(os.path.join(out_dir, SHARDS_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class Shard:
+
+    def __init__(self, shard_dir: str, sparse_dim: int):
+        self.shard_dir = shard_dir
+        self.rows = np.load(os.path.join(shard_dir, ROWS_FILE), mmap_mode="r")
+        self.sparse = csr_matrix(
+            (
+                np.load(os.path.join(shard_dir, DATA_FILE), mmap_mode="r"),
+                np.load(os.path.join(shard_dir, INDICES_FILE), mmap_mode="r"),
+                np.load(os.path.join(shard_dir, INDPTR_FILE), mmap_mode="r"),
+            ),
+            shape=(len(self.rows), sparse_dim),
+            copy=False,
+        )
+        self.index, self.manifest = load_index(os.path.join(shard_dir, FAISS_DIR))
+
+    def search(self, query_sparse_str, query_dense, top_k_lexical, top_k_semantic, ef_search=None):
+        """Per-shard top-k of both legs as (global rows, scores)."""
+        lex_rows, lex_scores = _empty(), _empty(np.float64)
+        if top_k_lexical and query_sparse_str is not None:
+            idx, lex_scores = lexical_candidates(self.sparse, query_sparse_str, top_k_lexical)
+            lex_rows = np.asarray(self.rows[idx], dtype=np.int64)
+
+        sem_rows, sem_dists = _empty(), _empty(np.float64)
+        if top_k_semantic and query_dense is not None:
+            idx, dists = semantic_candidates_faiss(
+                self.index, query_dense, top_k_semantic, ef_search=ef_search)
+            valid = idx[0] >= 0
+            sem_rows = np.asarray(self.rows[idx[0][valid]], dtype=np.int64)
+            sem_dists = dists[0][valid].astype(np.float64)
+
+        return lex_rows, lex_scores, sem_rows, sem_dists
+
+
+def _empty(dtype=np.int64):
+    return np.empty(0, dtype=dtype)
+
+
+def merge_top_k(rows_list, scores_list, top_k: int):
+    """Exact merge of per-shard top-k lists; lower score first, ties by row."""
+    rows = np.concatenate(rows_list) if rows_list else _empty()
+    scores = np.concatenate(scores_list) if scores_list else _empty(np.float64)
+    order = np.lexsort((rows, scores))[:top_k]
+    return rows[order], scores[order]
+
+
+# process-pool workers keep their opened shards between tasks
+_PROCESS_SHARDS = {}
+
+
+def _search_in_process(args):
+    shard_dir, sparse_dim, query = args
+    shard = _PROCESS_SHARDS.get(shard_dir)
+    if shard is None:
+        shard = _PROCESS_SHARDS[shard_dir] = Shard(shard_dir, sparse_dim)
+    return shard.search(*query)
+
+
+class RemoteShard:
+    """Client for a shard served by `python sharded.py serve`."""
+
+    def __init__(self, address, authkey: bytes = None):
+        self.address = tuple(address)
+        self.authkey = shard_authkey(authkey)
+        if self.authkey is None:
+            raise ValueError(f"No shard authkey: pass authkey or set ${AUTHKEY_ENV}")
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def search(self, *query):
+        with self._lock:
+            if self._conn is None:
+                self._conn = Client(self.address, authkey=self.authkey)
+            self._conn.send(query)
+            status, payload = self._conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Shard {self.address} failed: {payload}")
+        return payload
+
+
+def serve_shard(shard_dir: str, sparse_dim: int, address, authkey: bytes = None):
+    """Serve one shard over multiprocessing.connection; one thread per client."""
+    authkey = shard_authkey(authkey)
+    if authkey is None:
+        if not _is_loopback(address[0]):
+            raise ValueError(
+                f"Refusing to serve on {address[0]} without an authkey "
+                f"(set ${AUTHKEY_ENV} or pass --authkey-file)"
+            )
+        authkey = secrets.token_hex(32).encode()
+        print(f"No authkey given; clients must use {AUTHKEY_ENV}={authkey.decode()}")
+
+    shard = Shard(shard_dir, sparse_dim)
+    listener = Listener(tuple(address), authkey=authkey)
+    print(f"✓ Serving {shard_dir} ({len(shard.rows)} rows) on {address}")
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    query = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    conn.send(("ok", shard.search(*query)))
+                except Exception as e:
+                    conn.send(("error", repr(e)))
+
+    while True:
+        conn = listener.accept()
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+class ShardedRetriever:
+    """
+    mode="threads"    shards opened in this process, searched by a thread pool
+    mode="processes"  each pool process opens shards lazily (mmap, shared pages)
+    remote=[(host, port), ...]  one RemoteShard per address instead of local shards
+                                (authkey, or $RAG_SHARD_AUTHKEY)
+    """
+
+    def __init__(self, shards_dir: str, mode: str = "threads", n_workers: int = None,
+                 remote=None, authkey: bytes = None):
+        with open(os.path.join(shards_dir, SHARDS_MANIFEST)) as f:
+            self.manifest = json.load(f)
+
+        self.store = EmbeddingStore.open(self.manifest["store"])
+        self.sparse_dim = self.manifest["sparse_dim"]
+        self.shard_dirs = [os.path.join(shards_dir, s) for s in self.manifest["shards"]]
+        self.mode = "remote" if remote else mode
+
+        n_workers = n_workers or len(self.shard_dirs)
+        if self.mode == "remote":
+            self.shards = [RemoteShard(a, authkey) for a in remote]
+            self.pool = ThreadPoolExecutor(max_workers=len(self.shards))
+        elif self.mode == "threads":
+            self.shards = [Shard(d, self.sparse_dim) for d in self.shard_dirs]
+            self.pool = ThreadPoolExecutor(max_workers=n_workers)
+        elif self.mode == "processes":
+            self.shards = None
+            self.pool = ProcessPoolExecutor(max_workers=n_workers)
+        else:
+            raise ValueError(f"Unknown mode {mode!r}")
+
+    def close(self):
+        self.pool.shutdown()
+
+    def _scatter(self, query):
+        if self.mode == "processes":
+            jobs = [(d, self.sparse_dim, query) for d in self.shard_dirs]
+            return list(self.pool.map(_search_in_process, jobs))
+        return list(self.pool.map(lambda shard: shard.search(*query), self.shards))
+
+    def candidates(self, query_sparse_str, query_dense, top_k_lexical, top_k_semantic,
+                   ef_search=None):
+        """Merged (lex_rows, lex_scores, sem_rows, sem_dists) across shards."""
+        parts = self._scatter((query_sparse_str, query_dense, top_k_lexical, top_k_semantic, ef_search))
+
+        lex_rows, lex_scores = merge_top_k([p[0] for p in parts], [p[1] for p in parts], top_k_lexical)
+        sem_rows, sem_dists = merge_top_k([p[2] for p in parts], [p[3] for p in parts], top_k_semantic)
+        return lex_rows, lex_scores, sem_rows, sem_dists
+
+    def hybrid_search(self, query_sparse_str, query_dense, top_k_lexical, top_k_semantic,
+                      ef_search=None, union_all: bool = False) -> pd.DataFrame:
+        lex_rows, lex_scores, sem_rows, sem_dists = self.candidates(
+            query_sparse_str, query_dense, top_k_lexical, top_k_semantic, ef_search)
+
+        idx, lexical, cosine = fuse_candidates(
+            lex_rows, lex_scores, sem_rows, sem_dists, union_all=union_all)
+
+        uniq, inv = np.unique(idx, return_inverse=True)
+        out = take_rows(self.store, uniq).iloc[inv].reset_index(drop=True)
+        out["lexical_score"] = none_if_nan(lexical)
+        out["cosine_similarity"] = none_if_nan(cosine)
+        return out[RESULT_COLUMNS]
+
+    def lexical_retrieval(self, query_sparse_str, top_k: int) -> pd.DataFrame:
+        return self.hybrid_search(query_sparse_str, None, top_k, 0)
+
+    def semantic_retrieval(self, query_dense, top_k: int, ef_search=None) -> pd.DataFrame:
+        return self.hybrid_search(None, query_dense, 0, top_k, ef_search)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded retrieval")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="partition a store and build per-shard indexes")
+    build.add_argument("--store", default="embedded_store")
+    build.add_argument("--out", default="shards")
+    build.add_argument("--shards", type=int, default=os.cpu_count())
+    build.add_argument("--by", choices=["row", "article_id"], default="row")
+    build.add_argument("--m", type=int, default=M)
+    build.add_argument("--ef-construction", type=int, default=EF_CONSTRUCTION)
+    build.add_argument("--ef-search", type=int, default=EF_SEARCH)
+
+    serve = sub.add_parser("serve", help="serve one shard as a worker process")
+    serve.add_argument("shard_dir")
+    serve.add_argument("--host", default="localhost")
+    serve.add_argument("--port", type=int, required=True)
+    serve.add_argument("--authkey-file", default=None,
+                       help=f"file holding the shared authkey (default: ${AUTHKEY_ENV})")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build_shards(args.store, args.out, args.shards, args.by,
+                     args.m, args.ef_construction, args.ef_search)
+    else:
+        with open(os.path.join(os.path.dirname(os.path.abspath(args.shard_dir)), SHARDS_MANIFEST)) as f:
+            sparse_dim = json.load(f)["sparse_dim"]
+        authkey = None
+        if args.authkey_file:
+            with open(args.authkey_file, "rb") as f:
+                authkey = f.read().strip()
+        serve_shard(args.shard_dir, sparse_dim, (args.host, args.port), authkey)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+Columnar embedding store (replaces embedded_data.pickle).
+
+Layout of a store directory:
+    manifest.json        row count, dims, dtypes
+    dense.npy            (n, dense_dim) float32, C-contiguous
+    sparse_indptr.npy    CSR row pointers  (n + 1,) int64
+    sparse_indices.npy   CSR column ids    (nnz,)   int32
+    sparse_data.npy      CSR values        (nnz,)   float32
+    meta.parquet         embedding_id, article_id, document, metadata (JSON)
+
+Everything is opened lazily: the .npy files with np.load(mmap_mode="r")
+and the parquet file with a memory-mapped arrow reader, so opening a store
+only reads the manifest.
+
+Convert once:
+    python store.py convert embedded_data.pickle embedded_store
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy.sparse import csr_matrix
+
+
+MANIFEST_FILE = "manifest.json"
+DENSE_FILE = "dense.npy"
+INDPTR_FILE = "sparse_indptr.npy"
+INDICES_FILE = "sparse_indices.npy"
+DATA_FILE = "sparse_data.npy"
+META_FILE = "meta.parquet"
+
+META_COLUMNS = ["embedding_id", "article_id", "document", "metadata"]
+
+STORE_VERSION = 1
+
+
+class EmbeddingStore:
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+
+        self._dense = None
+        self._sparse = None
+        self._table = None
+        self._columns = {}
+
+    @classmethod
+    def open(cls, path: str) -> "EmbeddingStore":
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self.manifest["n_rows"]
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @property
+    def dense(self) -> np.ndarray:
+        # (n, dense_dim) float32, read-only memmap
+        if self._dense is None:
+            self._dense = np.load(self._file(DENSE_FILE), mmap_mode="r")
+        return self._dense
+
+    @property
+    def sparse(self) -> csr_matrix:
+        # CSR over memory-mapped buffers; scipy keeps the arrays as-is
+        # because the dtypes are already valid CSR dtypes
+        if self._sparse is None:
+            indptr = np.load(self._file(INDPTR_FILE), mmap_mode="r")
+            indices = np.load(self._file(INDICES_FILE), mmap_mode="r")
+            data = np.load(self._file(DATA_FILE), mmap_mode="r")
+            self._sparse = csr_matrix(
+                (data, indices, indptr),
+                shape=(len(self), self.manifest["sparse_dim"]),
+                copy=False,
+            )
+        return self._sparse
+
+    @property
+    def table(self) -> pa.Table:
+        if self._table is None:
+            self._table = pq.read_table(self._file(META_FILE), memory_map=True)
+        return self._table
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        """Full metadata column as a numpy array (cached)."""
+        if column == "dense_embedding":
+            return self.dense
+        if column == "sparse_embedding":
+            return self.sparse
+
+        if column not in self._columns:
+            values = self.table.column(column).to_numpy(zero_copy_only=False)
+            if column == "metadata":
+                values = np.array([json.loads(v) for v in values], dtype=object)
+            self._columns[column] = values
+        return self._columns[column]
+
+    def take(self, idx) -> pd.DataFrame:
+        """embedding_id / article_id / document / metadata for rows idx."""
+        idx = np.asarray(idx, dtype=np.int64)
+
+        out = self.table.take(pa.array(idx)).to_pandas()
+        out["metadata"] = [json.loads(v) for v in out["metadata"]]
+
+        return out[META_COLUMNS]
+
+
+def take_rows(source, idx) -> pd.DataFrame:
+    """
+    Gather result rows from either a DataFrame or an EmbeddingStore.
+    One vectorized gather, index reset to 0..len(idx)-1.
+    """
+    if isinstance(source, EmbeddingStore):
+        return source.take(idx)
+
+    return source[META_COLUMNS].iloc[np.asarray(idx, dtype=np.int64)].reset_index(drop=True)
+
+
+def dense_matrix(source) -> np.ndarray:
+    """(n, dim) float32 dense vectors, not normalized."""
+    if isinstance(source, EmbeddingStore):
+        return source.dense
+
+    return np.vstack(source["dense_embedding"].values).astype("float32")
+
+
+def write_store(df: pd.DataFrame, out_dir: str, sparse: csr_matrix) -> dict:
+    """
+    Write df (the embedded_data frame) and its parsed sparse matrix as a store.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    n = len(df)
+
+    # dense: fill an on-disk array row by row instead of np.vstack
+    first = np.asarray(df["dense_embedding"].iloc[0], dtype=np.float32)
+    dense = np.lib.format.open_memmap(
+        os.path.join(out_dir, DENSE_FILE), mode="w+",
+        dtype=np.float32, shape=(n, first.shape[0]),
+    )
+    for i, v in enumerate(df["dense_embedding"].values):
+        dense[i] = v
+    dense.flush()
+    del dense
+
+    sparse = sparse.tocsr()
+    sparse.sort_indices()
+    np.save(os.path.join(out_dir, INDPTR_FILE), sparse.indptr.astype(np.int64))
+    np.save(os.path.join(out_dir, INDICES_FILE), sparse.indices.astype(np.int32))
+    np.save(os.path.join(out_dir, DATA_FILE), sparse.data.astype(np.float32))
+
+    meta = pa.table({
+        "embedding_id": df["embedding_id"].values,
+        "article_id": df["article_id"].values,
+        "document": df["document"].astype(str).values,
+        "metadata": [json.dumps(m, default=str) for m in df["metadata"].values],
+    })
+    pq.write_table(meta, os.path.join(out_dir, META_FILE))
+
+    manifest = {
+        "version": STORE_VERSION,
+        "n_rows": n,
+        "dense_dim": int(first.shape[0]),
+        "sparse_dim": int(sparse.shape[1]),
+        "nnz": int(sparse.nnz),
+        "dense_dtype": "float32",
+        "sparse_index_dtype": "int32",
+        "sparse_value_dtype": "float32",
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def convert_pickle(pickle_path: str, out_dir: str, n_jobs: int = 1) -> dict:
+    from runner import build_sparse_matrix_bulk
+
+    with open(pickle_path, "rb") as f:
+        df = pickle.load(f)
+
+    sparse = build_sparse_matrix_bulk(df["sparse_embedding"], n_jobs=n_jobs)
+
+    return write_store(df, out_dir, sparse)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar embedding store")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    convert = sub.add_parser("convert", help="convert embedded_data.pickle to a store")
+    convert.add_argument("pickle_path", nargs="?", default="embedded_data.pickle")
+    convert.add_argument("out_dir", nargs="?", default="embedded_store")
+    convert.add_argument("--jobs", type=int, default=os.cpu_count(),
+                         help="processes used to parse sparse strings")
+
+    args = parser.parse_args(argv)
+
+    t0 = time.time()
+    manifest = convert_pickle(args.pickle_path, args.out_dir, args.jobs)
+    print(json.dumps(manifest, indent=2))
+    print(f"✓ Store written to {args.out_dir} in {time.time() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
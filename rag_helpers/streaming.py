@@ -0,0 +1,308 @@
+"""
+Bounded-memory streaming build of the store and the FAISS index.
+
+The embedding table is read in row batches. Each batch is normalized and
+added to the index, its dense rows are written into the on-disk dense.npy,
+its sparse strings are parsed and appended to on-disk CSR buffers, and its
+metadata is appended to meta.parquet. Peak memory follows --batch-size,
+not the corpus size (plus the index itself, which has to be resident).
+
+    python streaming.py embedded_data.parquet embedded_store --index faiss_index
+
+Parquet input (embedding_id, article_id, document, metadata,
+dense_embedding, sparse_embedding) is truly streamed. A pickle has to be
+unpickled whole, so only the derived copies (vstack, CSR lists) are bounded.
+
+Compressed index types are trained on the first batches (up to
+TRAIN_SAMPLE rows) instead of a sample of the whole corpus.
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import argparse
+import resource
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import faiss
+from scipy.sparse import csr_matrix
+
+from store import (
+    MANIFEST_FILE, DENSE_FILE, INDPTR_FILE, INDICES_FILE, DATA_FILE, META_FILE,
+    STORE_VERSION,
+)
+from runner import _sparse_block_counts, _parse_sparse_block
+from ann import (
+    M, EF_CONSTRUCTION, EF_SEARCH, NLIST, PQ_M, NPROBE, RERANK_FACTOR, TRAIN_SAMPLE, INDEX_TYPES,
+    new_index, index_factory_string, set_search_params, save_index,
+)
+
+
+BATCH_SIZE = 50_000
+PROGRESS_EVERY_S = 10.0
+COPY_CHUNK = 1 << 24  # elements per chunk when finalizing the CSR buffers
+
+
+def iter_row_batches(source_path: str, batch_size: int = BATCH_SIZE):
+    """(n_rows, iterator of DataFrame batches)."""
+    if source_path.endswith(".parquet"):
+        pf = pq.ParquetFile(source_path)
+        batches = (b.to_pandas() for b in pf.iter_batches(batch_size=batch_size))
+        return pf.metadata.num_rows, batches
+
+    with open(source_path, "rb") as f:
+        df = pickle.load(f)
+    return len(df), (df.iloc[a:a + batch_size] for a in range(0, len(df), batch_size))
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _Progress:
+
+    def __init__(self, n_rows: int, every_s: float = PROGRESS_EVERY_S):
+        self.n_rows = n_rows
+        self.every_s = every_s
+        self.t0 = self.last = time.time()
+
+    def update(self, done: int, force: bool = False) -> None:
+        now = time.time()
+        if not force and now - self.last < self.every_s:
+            return
+        self.last = now
+
+        elapsed = now - self.t0
+        rate = done / elapsed if elapsed else 0.0
+        eta = (self.n_rows - done) / rate if rate else float("inf")
+        print(f"{done}/{self.n_rows} rows ({100 * done / max(self.n_rows, 1):.1f}%) "
+              f"{rate:,.0f} rows/s, eta {eta:.0f}s, peak RSS {peak_rss_mb():.0f} MB")
+
+
+def _metadata_json(values) -> list:
+    # pickles carry dicts, parquet exports may already carry JSON text
+    return [v if isinstance(v, str) else json.dumps(v, default=str) for v in values]
+
+
+def _finalize_npy(raw_path: str, npy_path: str, dtype, n: int) -> None:
+    """Raw appended buffer → .npy, copied in chunks."""
+    raw = np.memmap(raw_path, dtype=dtype, mode="r", shape=(n,)) if n else np.empty(0, dtype=dtype)
+    out = np.lib.format.open_memmap(npy_path, mode="w+", dtype=dtype, shape=(n,))
+    for a in range(0, n, COPY_CHUNK):
+        out[a:a + COPY_CHUNK] = raw[a:a + COPY_CHUNK]
+    out.flush()
+    del out, raw
+    os.remove(raw_path)
+
+
+def stream_build(
+    source_path: str,
+    store_dir: str,
+    index_dir: str = None,
+    batch_size: int = BATCH_SIZE,
+    m: int = M,
+    ef_construction: int = EF_CONSTRUCTION,
+    ef_search: int = EF_SEARCH,
+    index_type: str = "hnsw_flat",
+    nlist: int = NLIST,
+    pq_m: int = PQ_M,
+    nprobe: int = NPROBE,
+    progress_every_s: float = PROGRESS_EVERY_S,
+) -> dict:
+    """
+    Writes a store to store_dir and, when index_dir is given, the FAISS
+    index with the same manifest as ann.build_and_save. Returns stats.
+    """
+    t0 = time.time()
+    n, batches = iter_row_batches(source_path, batch_size)
+    if not n:
+        raise ValueError(f"{source_path} has no rows")
+    os.makedirs(store_dir, exist_ok=True)
+
+    indices_raw = os.path.join(store_dir, INDICES_FILE + ".raw")
+    data_raw = os.path.join(store_dir, DATA_FILE + ".raw")
+    indptr = np.lib.format.open_memmap(
+        os.path.join(store_dir, INDPTR_FILE), mode="w+", dtype=np.int64, shape=(n + 1,))
+    indptr[0] = 0
+
+    dense = None
+    index = None
+    pending_train = []  # first batches, kept only until the index is trained
+    meta_writer = None
+    sparse_dim = None
+    dim = None
+    nnz = 0
+    done = 0
+    h = hashlib.sha256()
+    progress = _Progress(n, progress_every_s)
+
+    with open(indices_raw, "wb") as f_indices, open(data_raw, "wb") as f_data:
+        for batch in batches:
+            b = len(batch)
+            if not b:
+                continue
+
+            # ---- dense: normalize, store, add ----
+            vecs = np.vstack(batch["dense_embedding"].values).astype(np.float32)
+            if dense is None:
+                dim = vecs.shape[1]
+                dense = np.lib.format.open_memmap(
+                    os.path.join(store_dir, DENSE_FILE), mode="w+", dtype=np.float32, shape=(n, dim))
+                # same digest as ann.corpus_hash over the normalized matrix
+                h.update(str((n, dim)).encode())
+                if index_dir is not None:
+                    index = new_index(dim, n, m, ef_construction,
+                                      index_type=index_type, nlist=nlist, pq_m=pq_m)
+            elif vecs.shape[1] != dim:
+                raise ValueError("Dense dimension mismatch")
+
+            dense[done:done + b] = vecs
+            faiss.normalize_L2(vecs)
+            h.update(vecs.data)
+
+            if index is not None:
+                if index.is_trained:
+                    index.add(vecs)
+                else:
+                    pending_train.append(vecs)
+                    n_pending = sum(len(v) for v in pending_train)
+                    if n_pending >= min(TRAIN_SAMPLE, n) or done + b == n:
+                        sample = np.vstack(pending_train)
+                        index.train(sample[:TRAIN_SAMPLE])
+                        index.add(sample)
+                        pending_train = []
+                        del sample
+
+            # ---- sparse: parse, sort, append ----
+            strings = batch["sparse_embedding"].values
+            counts, dims = _sparse_block_counts(strings)
+            if sparse_dim is None:
+                sparse_dim = int(dims[0])
+            if (dims != sparse_dim).any():
+                raise ValueError("Sparse dimension mismatch")
+
+            local_indptr = np.zeros(b + 1, dtype=np.int64)
+            np.cumsum(counts, out=local_indptr[1:])
+            idx, val = _parse_sparse_block(strings, np.float32)
+            if len(idx) != local_indptr[-1]:
+                raise ValueError(f"Malformed sparse string in rows {done}..{done + b}")
+
+            block = csr_matrix((val, idx, local_indptr), shape=(b, sparse_dim), copy=False)
+            block.sort_indices()
+            block.indices.astype(np.int32).tofile(f_indices)
+            block.data.astype(np.float32).tofile(f_data)
+
+            indptr[done + 1:done + b + 1] = local_indptr[1:] + nnz
+            nnz += int(local_indptr[-1])
+
+            # ---- metadata ----
+            meta = pa.table({
+                "embedding_id": batch["embedding_id"].values,
+                "article_id": batch["article_id"].values,
+                "document": batch["document"].astype(str).values,
+                "metadata": _metadata_json(batch["metadata"].values),
+            })
+            if meta_writer is None:
+                meta_writer = pq.ParquetWriter(os.path.join(store_dir, META_FILE), meta.schema)
+            meta_writer.write_table(meta)
+
+            done += b
+            progress.update(done)
+
+    if done != n:
+        raise ValueError(f"Source yielded {done} rows, expected {n}")
+
+    if meta_writer is not None:
+        meta_writer.close()
+    dense.flush()
+    indptr.flush()
+    del dense, indptr
+
+    _finalize_npy(indices_raw, os.path.join(store_dir, INDICES_FILE), np.int32, nnz)
+    _finalize_npy(data_raw, os.path.join(store_dir, DATA_FILE), np.float32, nnz)
+
+    store_manifest = {
+        "version": STORE_VERSION,
+        "n_rows": n,
+        "dense_dim": int(dim),
+        "sparse_dim": int(sparse_dim),
+        "nnz": nnz,
+        "dense_dtype": "float32",
+        "sparse_index_dtype": "int32",
+        "sparse_value_dtype": "float32",
+    }
+    with open(os.path.join(store_dir, MANIFEST_FILE), "w") as f:
+        json.dump(store_manifest, f, indent=2)
+
+    if index is not None:
+        set_search_params(index, index_type, ef_search=ef_search, nprobe=nprobe)
+        index_manifest = {
+            "index_type": index_type,
+            "dim": int(dim),
+            "n_vectors": n,
+            "m": m,
+            "ef_construction": ef_construction,
+            "ef_search": ef_search,
+            "metric": "inner_product",
+            "rerank_factor": 0 if index_type == "hnsw_flat" else RERANK_FACTOR,
+            "corpus_hash": h.hexdigest(),
+            "source": os.path.abspath(source_path),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        if index_type == "ivf_pq":
+            index_manifest.update({
+                "factory": index_factory_string(index_type, n, m, nlist, pq_m),
+                # the list count actually built (nlist=None sizes it from the row count)
+                "nlist": int(faiss.extract_index_ivf(index).nlist),
+                "pq_m": pq_m,
+                "nprobe": nprobe,
+            })
+        save_index(index, index_dir, index_manifest)
+
+    progress.update(done, force=True)
+    elapsed = time.time() - t0
+    stats = {
+        "rows": n,
+        "nnz": nnz,
+        "seconds": elapsed,
+        "rows_per_s": n / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(f"✓ Streamed {n} rows in {elapsed:.1f}s → {store_dir}"
+          + (f", {index_dir}" if index_dir else ""))
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bounded-memory streaming store/index build")
+    parser.add_argument("source", help=".parquet (streamed) or .pickle")
+    parser.add_argument("store_dir")
+    parser.add_argument("--index", default=None, help="also build the FAISS index here")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="hnsw_flat")
+    parser.add_argument("--m", type=int, default=M)
+    parser.add_argument("--ef-construction", type=int, default=EF_CONSTRUCTION)
+    parser.add_argument("--ef-search", type=int, default=EF_SEARCH)
+    parser.add_argument("--nlist", type=int, default=NLIST)
+    parser.add_argument("--pq-m", type=int, default=PQ_M)
+    parser.add_argument("--nprobe", type=int, default=NPROBE)
+    parser.add_argument("--progress-every", type=float, default=PROGRESS_EVERY_S)
+    args = parser.parse_args(argv)
+
+    stats = stream_build(
+        args.source, args.store_dir, args.index,
+        batch_size=args.batch_size, m=args.m, ef_construction=args.ef_construction,
+        ef_search=args.ef_search, index_type=args.index_type,
+        nlist=args.nlist, pq_m=args.pq_m, nprobe=args.nprobe,
+        progress_every_s=args.progress_every,
+    )
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
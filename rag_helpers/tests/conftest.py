@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# the rag_helpers modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import synthetic_store  # noqa: E402
+
+
+@pytest.fixture
+def small_store(tmp_path):
+    return synthetic_store(300, str(tmp_path / "store"), dense_dim=32, sparse_dim=1000,
+                           terms_per_doc=20)
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from ann import INDEX_FILE, build_index, corpus_hash, load_dense_matrix, load_index, save_index
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads /proc/self/maps")
+def test_load_index_is_mmap_backed(small_store, tmp_path):
+    dense = load_dense_matrix(small_store)
+    index = build_index(dense, m=8, ef_construction=40, ef_search=64)
+    index_dir = str(tmp_path / "index")
+    save_index(index, index_dir, {"index_type": "hnsw_flat", "dim": dense.shape[1],
+                                  "ef_search": 64, "corpus_hash": corpus_hash(dense)})
+
+    loaded, _ = load_index(index_dir)
+
+    # the vectors must stay in a mapping of the index file, not a private copy
+    index_path = os.path.realpath(os.path.join(index_dir, INDEX_FILE))
+    with open("/proc/self/maps") as f:
+        assert index_path in f.read()
+
+    expected = index.search(dense[:5], 10)
+    found = loaded.search(dense[:5], 10)
+    np.testing.assert_array_equal(found[1], expected[1])
@@ -0,0 +1,28 @@
+import numpy as np
+
+from ann import build_index, load_dense_matrix
+from filters import FilterIndex, semantic_candidates_filtered
+
+
+def test_save_and_load_postings(small_store, tmp_path):
+    filter_index = FilterIndex.from_store(small_store)
+    filter_index.save(str(tmp_path / "filters"))
+
+    loaded = FilterIndex.load(str(tmp_path / "filters"))
+
+    article_ids = np.unique(small_store["article_id"])[:3].tolist()
+    filters = {"article_id": article_ids}
+    np.testing.assert_array_equal(loaded.compile(filters), filter_index.compile(filters))
+
+
+def test_filtered_search_on_ivf_pq(small_store):
+    dense = load_dense_matrix(small_store)
+    index = build_index(dense, index_type="ivf_pq", nlist=8, pq_m=8, nprobe=8)
+    mask = np.zeros(len(small_store), dtype=bool)
+    mask[::2] = True
+
+    # exact_max_rows=0 forces the FAISS path
+    idx, _ = semantic_candidates_filtered(index, dense[0], 10, mask, exact_max_rows=0)
+
+    assert len(idx) == 10
+    assert mask[idx].all()
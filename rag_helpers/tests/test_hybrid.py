@@ -0,0 +1,20 @@
+from bench import make_queries
+from hybrid import hybrid_search_fused
+from runner import hybrid_search
+
+
+def test_fused_without_index(small_store):
+    dense, sparse_strs, _ = make_queries(small_store, 1)
+
+    out = hybrid_search_fused(small_store, small_store.sparse, sparse_strs[0], dense[0], 10, 10)
+
+    assert out["embedding_id"].is_unique
+    assert out["cosine_similarity"].notna().sum() == 10
+
+
+def test_runner_hybrid_search_is_union_all(small_store):
+    dense, sparse_strs, _ = make_queries(small_store, 1)
+
+    out = hybrid_search(small_store, small_store.sparse, sparse_strs[0], dense[0], 10, 10)
+
+    assert len(out) == 20
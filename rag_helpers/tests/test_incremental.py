@@ -0,0 +1,89 @@
+import faiss
+import numpy as np
+
+from ann import build_index, load_dense_matrix
+from incremental import IncrementalIndex
+from runner import format_sparse_string
+from store import EmbeddingStore
+
+
+def _new_rows(store, positions, first_id):
+    rows = store.take(positions)
+    rows["embedding_id"] = np.arange(first_id, first_id + len(positions))
+    rows["dense_embedding"] = list(store.dense[positions])
+    sparse = store.sparse
+    rows["sparse_embedding"] = [
+        format_sparse_string(sparse[p].indices, sparse[p].data, sparse.shape[1]) for p in positions
+    ]
+    return rows
+
+
+def test_compact_then_save_and_load(small_store, tmp_path):
+    index = build_index(load_dense_matrix(small_store), m=8, ef_construction=40, ef_search=64)
+    live = IncrementalIndex.from_store(small_store, index)
+
+    live.upsert(_new_rows(small_store, [10, 11, 12], first_id=10_000))
+    deleted = small_store["embedding_id"][:3]
+    live.delete(deleted)
+
+    live.compact()
+
+    assert isinstance(live.store, EmbeddingStore)
+    assert len(live.store) == len(live) == len(small_store)
+
+    state_dir = str(tmp_path / "state")
+    live.save(state_dir)
+    loaded = IncrementalIndex.load(state_dir)
+
+    assert len(loaded) == len(live)
+    live_ids = set(loaded.ids[loaded.alive].tolist())
+    assert {10_000, 10_001, 10_002} <= live_ids
+    assert live_ids.isdisjoint(deleted.tolist())
+
+    query = small_store.dense[20]
+    np.testing.assert_array_equal(loaded.dense_candidates(query, 10)[0],
+                                  live.dense_candidates(query, 10)[0])
+
+
+def test_compact_keeps_index_type(small_store):
+    manifest = {"index_type": "hnsw_sq8", "m": 8, "ef_construction": 40, "ef_search": 64}
+    index = build_index(load_dense_matrix(small_store), m=8, ef_construction=40, ef_search=64,
+                        index_type="hnsw_sq8")
+    live = IncrementalIndex.from_store(small_store, index, manifest)
+    live.delete(small_store["embedding_id"][:3])
+
+    live.compact()
+
+    assert isinstance(faiss.downcast_index(live.index), faiss.IndexHNSWSQ)
+    assert live.manifest["index_type"] == "hnsw_sq8"
+    assert live.index.ntotal == len(small_store) - 3
+
+
+def test_positions_resolve_against_their_snapshot(small_store):
+    index = build_index(load_dense_matrix(small_store), m=8, ef_construction=40, ef_search=64)
+    live = IncrementalIndex.from_store(small_store, index)
+    live.upsert(_new_rows(small_store, [10, 11, 12], first_id=10_000))
+    live.delete(small_store["embedding_id"][:50])
+
+    snap = live.snapshot()
+    pos, _ = snap.dense_candidates(small_store.dense[11], 5)
+    expected = snap.take(pos)["embedding_id"].tolist()
+
+    live.compact()
+
+    assert snap.take(pos)["embedding_id"].tolist() == expected
+    assert 10_001 in expected
+
+
+def test_ivf_pq_search_after_delete(small_store):
+    dense = load_dense_matrix(small_store)
+    index = build_index(dense, index_type="ivf_pq", nlist=8, pq_m=8, nprobe=8)
+    live = IncrementalIndex.from_store(small_store, index, {"index_type": "ivf_pq", "nlist": 8,
+                                                            "pq_m": 8, "nprobe": 8})
+    deleted = small_store["embedding_id"][:3]
+    live.delete(deleted)
+
+    out = live.semantic_retrieval(dense[0], 10)
+
+    assert len(out) == 10
+    assert set(out["embedding_id"]).isdisjoint(deleted.tolist())
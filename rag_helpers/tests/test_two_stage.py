@@ -0,0 +1,23 @@
+import numpy as np
+
+from bench import make_queries
+from runner import normalize_rows
+from two_stage import two_stage_candidates
+
+
+def test_two_stage_without_index(small_store):
+    dense, sparse_strs, _ = make_queries(small_store, 1)
+
+    idx, fused, lexical, cosine = two_stage_candidates(
+        small_store.sparse, small_store.dense, sparse_strs[0], dense[0], top_k=10,
+    )
+
+    assert len(idx) == 10
+    assert np.all(np.diff(fused) <= 0)
+
+    # same result as passing the normalized corpus explicitly
+    expected = two_stage_candidates(
+        small_store.sparse, small_store.dense, sparse_strs[0], dense[0], top_k=10,
+        doc_normalized=normalize_rows(small_store.dense),
+    )
+    np.testing.assert_array_equal(idx, expected[0])
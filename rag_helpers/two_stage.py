@@ -0,0 +1,150 @@
+"""
+Two-stage hybrid retrieval: cheap candidates, exact hybrid rescoring.
+
+Stage 1 takes modest candidate sets from both legs (HNSW or exact dense,
+exact sparse) through hybrid_candidates. Stage 2 scores the union of
+candidates exactly on BOTH signals from the stored vectors (dense cosine
+from the full-precision rows, sparse inner product from the CSR rows),
+so a row found by one leg still gets its score from the other, and
+ranks them with one fused score:
+
+    fusion="rrf"        sum of 1 / (rrf_k + rank) over both signals
+    fusion="weighted"   dense_weight * cos + (1 - dense_weight) * ip,
+                        each min-max scaled over the candidates
+
+    hybrid_search_two_stage(store, store.sparse, store.dense, query_sparse, query_dense,
+                            top_k=20, k_lexical=50, k_semantic=50, index=index)
+
+Every returned row carries both lexical_score and cosine_similarity (same
+conventions as the single-leg functions) plus the fused hybrid_score,
+higher is better.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from store import take_rows
+from runner import RESULT_COLUMNS, query_to_sparse_vector, normalize_rows
+from hybrid import hybrid_candidates
+
+
+FUSIONS = ("rrf", "weighted")
+RRF_K = 60
+DENSE_WEIGHT = 0.5
+
+
+def rescore_exact(
+    cand: np.ndarray,
+    doc_sparse_matrix: csr_matrix,
+    dense_vectors: np.ndarray,
+    query_sparse_str: str,
+    query_dense: np.ndarray,
+):
+    """(cosine similarity, sparse inner product) of every candidate row."""
+    # sorted gather reads the memmaps sequentially
+    order = np.argsort(cand)
+    rows = cand[order]
+
+    q = normalize_rows(query_dense)[0]
+    sims = np.empty(len(cand))
+    sims[order] = normalize_rows(dense_vectors[rows]) @ q
+
+    query_vec = query_to_sparse_vector(query_sparse_str)
+    ips = np.empty(len(cand))
+    ips[order] = (doc_sparse_matrix[rows] @ query_vec.T).toarray().ravel()
+
+    return sims, ips
+
+
+def _ranks(scores: np.ndarray) -> np.ndarray:
+    # 1 = best (highest), ties by candidate position
+    order = np.argsort(-scores, kind="stable")
+    ranks = np.empty(len(scores), dtype=np.int64)
+    ranks[order] = np.arange(1, len(scores) + 1)
+    return ranks
+
+
+def _min_max(x: np.ndarray) -> np.ndarray:
+    span = x.max() - x.min() if len(x) else 0.0
+    return (x - x.min()) / span if span > 0 else np.zeros(len(x))
+
+
+def fuse_scores(sims, ips, fusion: str = "rrf", dense_weight: float = DENSE_WEIGHT,
+                rrf_k: int = RRF_K) -> np.ndarray:
+    """Fused score per candidate, higher is better."""
+    if fusion == "rrf":
+        return 1.0 / (rrf_k + _ranks(sims)) + 1.0 / (rrf_k + _ranks(ips))
+    if fusion == "weighted":
+        return dense_weight * _min_max(sims) + (1 - dense_weight) * _min_max(ips)
+    raise ValueError(f"Unknown fusion {fusion!r}, expected one of {FUSIONS}")
+
+
+def two_stage_candidates(
+    doc_sparse_matrix: csr_matrix,
+    dense_vectors: np.ndarray,
+    query_sparse_str: str,
+    query_dense: np.ndarray,
+    top_k: int,
+    k_lexical: int = 50,
+    k_semantic: int = 50,
+    index=None,
+    doc_normalized: np.ndarray = None,
+    fusion: str = "rrf",
+    dense_weight: float = DENSE_WEIGHT,
+    rrf_k: int = RRF_K,
+):
+    """
+    Returns (idx, hybrid_score, lexical_score, cosine_distance) for the
+    top_k rows by fused score, best first; no row data.
+    Without an index the dense leg is exact over doc_normalized
+    (normalized from dense_vectors when not given).
+    """
+    if index is None and doc_normalized is None:
+        doc_normalized = normalize_rows(dense_vectors)
+
+    lex_idx, _, sem_idx, _ = hybrid_candidates(
+        doc_sparse_matrix, query_sparse_str, query_dense, k_lexical, k_semantic,
+        index=index, doc_normalized=doc_normalized,
+    )
+
+    # union, first occurrence order (lexical, then semantic-only)
+    all_idx = np.concatenate([lex_idx, sem_idx]).astype(np.int64)
+    _, first = np.unique(all_idx, return_index=True)
+    cand = all_idx[np.sort(first)]
+
+    sims, ips = rescore_exact(cand, doc_sparse_matrix, dense_vectors, query_sparse_str, query_dense)
+    fused = fuse_scores(sims, ips, fusion, dense_weight, rrf_k)
+
+    best = np.argsort(-fused, kind="stable")[:top_k]
+    # pgvector conventions: <#> - 1 and cosine distance
+    return cand[best], fused[best], -ips[best] - 1, 1.0 - sims[best]
+
+
+def hybrid_search_two_stage(
+    df,
+    doc_sparse_matrix: csr_matrix,
+    dense_vectors: np.ndarray,
+    query_sparse_str: str,
+    query_dense: np.ndarray,
+    top_k: int,
+    k_lexical: int = 50,
+    k_semantic: int = 50,
+    index=None,
+    doc_normalized: np.ndarray = None,
+    fusion: str = "rrf",
+    dense_weight: float = DENSE_WEIGHT,
+    rrf_k: int = RRF_K,
+) -> pd.DataFrame:
+    idx, hybrid_score, lexical_scores, cosine = two_stage_candidates(
+        doc_sparse_matrix, dense_vectors, query_sparse_str, query_dense, top_k,
+        k_lexical, k_semantic, index=index, doc_normalized=doc_normalized,
+        fusion=fusion, dense_weight=dense_weight, rrf_k=rrf_k,
+    )
+
+    df_out = take_rows(df, idx)
+    df_out["lexical_score"] = lexical_scores
+    df_out["cosine_similarity"] = cosine
+    df_out["hybrid_score"] = hybrid_score
+
+    return df_out[RESULT_COLUMNS + ["hybrid_score"]]
@@ -0,0 +1,179 @@
+"""
+Compact vocabulary for the ~995,300-dim sparse space.
+
+A corpus only uses a small share of the declared term ids. Vocabulary maps
+the used global ids to dense local ids 0..V-1 (built once at index time);
+queries are remapped the same way and terms the corpus never uses are
+dropped before scoring, since they cannot contribute to any score.
+
+CompactLexicalIndex stores the remapped document matrix column-major
+(CSC), because scoring is driven by the query terms: each query term reads
+one contiguous column slice. Row ids are int32 and values float32 (or
+float16 on request, halving the postings again; scores are still
+accumulated in float64).
+
+    compact = CompactLexicalIndex.from_sparse(store.sparse)
+    compact.save("lexical_compact")
+    compact = CompactLexicalIndex.load("lexical_compact")
+    lexical_retrieval_compact(store, compact, query_sparse_str, top_k=20)
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, csc_matrix
+
+from store import take_rows
+from runner import RESULT_COLUMNS, parse_sparse_string_fast
+
+
+VOCAB_FILE = "vocab.npy"
+INDPTR_FILE = "csc_indptr.npy"
+ROWS_FILE = "csc_rows.npy"
+DATA_FILE = "csc_data.npy"
+MANIFEST_FILE = "manifest.json"
+
+
+class Vocabulary:
+
+    def __init__(self, global_ids: np.ndarray, global_dim: int):
+        # sorted, unique global term ids; position == local id
+        self.global_ids = np.asarray(global_ids, dtype=np.int64)
+        self.global_dim = global_dim
+
+    @classmethod
+    def from_sparse(cls, doc_sparse_matrix: csr_matrix) -> "Vocabulary":
+        return cls(np.unique(doc_sparse_matrix.indices), doc_sparse_matrix.shape[1])
+
+    def __len__(self) -> int:
+        return len(self.global_ids)
+
+    def to_local(self, global_ids: np.ndarray):
+        """(local ids, mask of known terms) for global ids."""
+        global_ids = np.asarray(global_ids, dtype=np.int64)
+        pos = np.searchsorted(self.global_ids, global_ids)
+        pos_clipped = np.minimum(pos, max(len(self.global_ids) - 1, 0))
+        known = (pos < len(self.global_ids)) & (self.global_ids[pos_clipped] == global_ids)
+        return pos_clipped[known].astype(np.int32), known
+
+    def remap_matrix(self, doc_sparse_matrix: csr_matrix, dtype=np.float32) -> csr_matrix:
+        local, known = self.to_local(doc_sparse_matrix.indices)
+        if not known.all():
+            raise ValueError("Matrix uses terms outside the vocabulary")
+        return csr_matrix(
+            (doc_sparse_matrix.data.astype(dtype), local, doc_sparse_matrix.indptr),
+            shape=(doc_sparse_matrix.shape[0], len(self)),
+        )
+
+    def remap_query(self, query_sparse_str: str):
+        """(local term ids, weights) with unknown terms dropped."""
+        d, dim = parse_sparse_string_fast(query_sparse_str)
+        if dim != self.global_dim:
+            raise ValueError("Sparse dimension mismatch")
+
+        terms = np.fromiter(d.keys(), dtype=np.int64, count=len(d))
+        weights = np.fromiter(d.values(), dtype=np.float64, count=len(d))
+        local, known = self.to_local(terms)
+        return local, weights[known]
+
+
+class CompactLexicalIndex:
+
+    def __init__(self, vocab: Vocabulary, indptr, rows, data, n_docs: int):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.rows = rows
+        self.data = data
+        self.n_docs = n_docs
+
+    @classmethod
+    def from_sparse(cls, doc_sparse_matrix: csr_matrix, value_dtype=np.float32) -> "CompactLexicalIndex":
+        vocab = Vocabulary.from_sparse(doc_sparse_matrix)
+        local = vocab.remap_matrix(doc_sparse_matrix, dtype=np.float32)
+
+        csc = csc_matrix(local)
+        csc.sum_duplicates()
+        return cls(
+            vocab,
+            csc.indptr.astype(np.int64),
+            csc.indices.astype(np.int32),
+            csc.data.astype(value_dtype),
+            doc_sparse_matrix.shape[0],
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.indptr.nbytes + self.rows.nbytes + self.data.nbytes
+                   + self.vocab.global_ids.nbytes)
+
+    def save(self, out_dir: str) -> None:
+        os.makedirs(out_dir, exist_ok=True)
+        np.save(os.path.join(out_dir, VOCAB_FILE), self.vocab.global_ids)
+        np.save(os.path.join(out_dir, INDPTR_FILE), self.indptr)
+        np.save(os.path.join(out_dir, ROWS_FILE), self.rows)
+        np.save(os.path.join(out_dir, DATA_FILE), self.data)
+
+        with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+            json.dump({
+                "n_docs": self.n_docs,
+                "global_dim": self.vocab.global_dim,
+                "vocab_size": len(self.vocab),
+                "nnz": int(self.rows.size),
+                "value_dtype": str(self.data.dtype),
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "CompactLexicalIndex":
+        mode = "r" if mmap else None
+        with open(os.path.join(index_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+
+        vocab = Vocabulary(np.load(os.path.join(index_dir, VOCAB_FILE)), manifest["global_dim"])
+        return cls(
+            vocab,
+            np.load(os.path.join(index_dir, INDPTR_FILE), mmap_mode=mode),
+            np.load(os.path.join(index_dir, ROWS_FILE), mmap_mode=mode),
+            np.load(os.path.join(index_dir, DATA_FILE), mmap_mode=mode),
+            manifest["n_docs"],
+        )
+
+    def inner_products(self, query_sparse_str: str) -> np.ndarray:
+        """(n_docs,) query · document, reading one column slice per known query term."""
+        terms, weights = self.vocab.remap_query(query_sparse_str)
+
+        starts, stops = self.indptr[terms], self.indptr[terms + 1]
+        if not len(terms) or not (stops > starts).any():
+            return np.zeros(self.n_docs)
+
+        rows = np.concatenate([self.rows[a:b] for a, b in zip(starts, stops)])
+        contrib = np.concatenate([
+            w * self.data[a:b].astype(np.float64) for w, a, b in zip(weights, starts, stops)
+        ])
+        return np.bincount(rows, weights=contrib, minlength=self.n_docs)
+
+    def candidates(self, query_sparse_str: str, top_k: int):
+        """(row idx, lexical_score) of the top_k rows, best first; no row data."""
+        # pgvector <#> == negative inner product, EXACT SQL match
+        lexical_scores = -self.inner_products(query_sparse_str) - 1
+
+        k = min(top_k, self.n_docs)
+        part = np.argpartition(lexical_scores, k - 1)[:k] if k < self.n_docs else np.arange(self.n_docs)
+        idx = part[np.lexsort((part, lexical_scores[part]))]
+        return idx, lexical_scores[idx]
+
+
+def lexical_retrieval_compact(
+    df,
+    compact_index: CompactLexicalIndex,
+    query_sparse_str: str,
+    top_k: int
+) -> pd.DataFrame:
+    """Drop-in replacement for lexical_retrieval_fast on the remapped index."""
+    idx, lexical_scores = compact_index.candidates(query_sparse_str, top_k)
+
+    df_out = take_rows(df, idx)
+    df_out["lexical_score"] = lexical_scores
+    df_out["cosine_similarity"] = None
+
+    return df_out[RESULT_COLUMNS]
@@ -0,0 +1,238 @@
+"""
+Content-addressed on-disk cache for LLM responses (SQLite).
+
+The key is a SHA-256 of model, deployment, temperature, messages, any
+extra request parameters and PROMPT_VERSION, so an identical request is
+answered from disk on every rerun. Both pipelines (call_driver_gen and
+call_analysis) import this one module and default to the same cache file
+(LLM_CACHE_PATH), so identical prompts are shared. Install it once from
+the repository root:
+
+    pip install -e shared
+
+    cache = LLMCache()                          # read-write
+    cache = LLMCache(read_only=True)            # replay: misses raise CacheMiss
+
+    # AzureOpenAI
+    content = cached_chat_completion(client, cache, model=MODEL, temperature=0.3, messages=[...])
+    if is_cached(client, cache, model=MODEL, temperature=0.3, messages=[...]): ...
+
+    # any client with .chat(messages) / .chat_json(prompt); the cache file
+    # is opened on first use
+    llm = CachedLLMClient(LLMClient(), deployment="gpt-4o")
+
+    cache.stats()   # hits, misses, hit_rate, entries, bytes, evictions
+
+The file is kept under max_bytes by evicting least recently used entries.
+Bump PROMPT_VERSION (or LLM_PROMPT_VERSION) to invalidate after prompt changes.
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.expanduser("~/.cache/llm_responses.sqlite"))
+MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+READ_ONLY = os.environ.get("LLM_CACHE_READ_ONLY", "0") == "1"
+PROMPT_VERSION = os.environ.get("LLM_PROMPT_VERSION", "1")
+
+EVICT_TO = 0.9  # evict down to this share of max_bytes
+
+
+class CacheMiss(KeyError):
+    pass
+
+
+def cache_key(model, messages, temperature=None, deployment=None,
+              prompt_version=PROMPT_VERSION, **params):
+    payload = {
+        "model": model,
+        "deployment": deployment,
+        "temperature": temperature,
+        "messages": messages,
+        "prompt_version": prompt_version,
+        "params": params,
+    }
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_BYTES, read_only=READ_ONLY):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self.conn.commit()
+
+        self.bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            if not self.read_only:
+                self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+            return row[0]
+
+    def put(self, key, value):
+        # None (e.g. a filtered completion) is not an answer worth replaying
+        if self.read_only or value is None:
+            return
+
+        size = len(key) + len(value.encode("utf-8"))
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self.bytes += size - (old[0] if old else 0)
+            if self.bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        target = self.max_bytes * EVICT_TO
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+
+        doomed = []
+        for key, size in rows:
+            if self.bytes <= target:
+                break
+            doomed.append((key,))
+            self.bytes -= size
+
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def __contains__(self, key):
+        """Presence check; not counted as a hit or miss, LRU order untouched."""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+
+    def get_or_call(self, key, fn):
+        """Cached value for key, else fn() (stored). Replay mode raises CacheMiss instead of calling."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        if self.read_only:
+            raise CacheMiss(key)
+
+        value = fn()
+        self.put(key, value)
+        return value
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "bytes": self.bytes,
+            "evictions": self.evictions,
+        }
+
+
+def chat_completion_key(client, model, messages, temperature=None,
+                        prompt_version=PROMPT_VERSION, **params):
+    deployment = getattr(client, "_azure_deployment", None)
+    return cache_key(model, messages, temperature, deployment, prompt_version, **params)
+
+
+def is_cached(client, cache, model, messages, temperature=None,
+              prompt_version=PROMPT_VERSION, **params):
+    """Would cached_chat_completion with these arguments be answered from disk?"""
+    return chat_completion_key(client, model, messages, temperature, prompt_version, **params) in cache
+
+
+def cached_chat_completion(client, cache, model, messages, temperature=None,
+                           prompt_version=PROMPT_VERSION, **params):
+    """client.chat.completions.create(...) → message content, through the cache."""
+    key = chat_completion_key(client, model, messages, temperature, prompt_version, **params)
+
+    def call():
+        response = client.chat.completions.create(
+            model=model, temperature=temperature, messages=messages, **params
+        )
+        return response.choices[0].message.content
+
+    return cache.get_or_call(key, call)
+
+
+class CachedLLMClient:
+    """
+    Wraps a client exposing .chat(messages) and .chat_json(prompt).
+    deployment (the model / deployment the client talks to) is part of
+    every key, so it is required: answers of different models never mix.
+    """
+
+    def __init__(self, client, deployment, cache=None, prompt_version=PROMPT_VERSION):
+        if not deployment:
+            raise ValueError("CachedLLMClient needs the model / deployment name the client uses")
+        self.client = client
+        self.deployment = deployment
+        self._cache = cache
+        self._cache_lock = threading.Lock()
+        self.prompt_version = prompt_version
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            with self._cache_lock:
+                if self._cache is None:
+                    self._cache = LLMCache()
+        return self._cache
+
+    def _key(self, method, messages, kwargs):
+        params = {k: v for k, v in kwargs.items() if k != "temperature"}
+        return cache_key(None, messages, kwargs.get("temperature"), self.deployment,
+                         prompt_version=self.prompt_version, method=method, **params)
+
+    def chat(self, messages, **kwargs):
+        key = self._key("chat", messages, kwargs)
+        return self.cache.get_or_call(key, lambda: self.client.chat(messages, **kwargs))
+
+    def chat_json(self, prompt, **kwargs):
+        key = self._key("chat_json", prompt, kwargs)
+        value = self.cache.get_or_call(
+            key, lambda: json.dumps(self.client.chat_json(prompt, **kwargs))
+        )
+        return json.loads(value)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)